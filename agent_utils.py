@@ -0,0 +1,101 @@
+import io
+import logging
+import re
+import sys
+from datetime import date
+
+from phi.agent import Agent
+
+
+TASK_HEADER_RE = re.compile(r"^#{1,6}\s*Task\s+(\d+)\b[^\n]*$", re.MULTILINE)
+STDOUT_FLUSH_SIZE = 4096
+
+
+def date_instruction() -> str:
+    """
+    Today's date as an agent instruction. Unlike `add_datetime_to_instructions`, which embeds
+    the current time down to the microsecond, it keeps the system prompt identical for a whole
+    day, so Groq can reuse its cached prompt prefix across requests.
+    """
+
+    return f"Today's date is {date.today().isoformat()}."
+
+
+def _split_batched_response(content: str, count: int) -> list[str | None]:
+    """Splits a batched response on its '### Task N' headers, in task order."""
+
+    sections = {}
+    matches = list(TASK_HEADER_RE.finditer(content))
+
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        end = next_match.start() if next_match else len(content)
+        sections[int(match.group(1))] = content[match.end():end].strip()
+
+    return [sections.get(i) for i in range(1, count + 1)]
+
+
+async def batch_prompt(agent: Agent, items: list[str], header: str) -> list[str | None]:
+    """
+    Sends several tasks to the agent in a single run and splits the answers.
+
+    Args:
+        agent: The agent to run.
+        items: The individual tasks (topics, questions...).
+        header: Instruction placed before the numbered tasks.
+
+    Returns:
+        One answer per item, in order; None for any task missing from the response.
+    """
+
+    tasks = "".join(f"\n\n### Task {i}: {item}" for i, item in enumerate(items, start=1))
+    prompt = (
+        f"{header}{tasks}\n\n"
+        f"Answer all {len(items)} tasks. Start each answer with its own header line, "
+        "exactly '### Task <number>', and do not use that header anywhere else."
+    )
+
+    logging.info(f"Sending {len(items)} tasks in a single batched request.")
+
+    response = await agent.arun(prompt, stream=False)
+    answers = _split_batched_response(response.content or "", len(items))
+
+    missing = [i for i, answer in enumerate(answers, start=1) if answer is None]
+    if missing:
+        logging.warning(f"Batched response is missing answers for tasks: {missing}")
+
+    return answers
+
+
+async def stream_to_stdout(agent: Agent, prompt: str) -> str:
+    """
+    Streams the agent's response to stdout. Chunks are buffered and written once a
+    newline arrives or the buffer reaches STDOUT_FLUSH_SIZE, instead of one write per token.
+
+    Returns:
+        The complete response text.
+    """
+
+    buffer = io.StringIO()
+    parts = []
+
+    def flush():
+        sys.stdout.write(buffer.getvalue())
+        sys.stdout.flush()
+        buffer.seek(0)
+        buffer.truncate()
+
+    async for chunk in await agent.arun(prompt, stream=True):
+        content = chunk.content if isinstance(chunk.content, str) else None
+        if not content:
+            continue
+
+        parts.append(content)
+        buffer.write(content)
+
+        if "\n" in content or buffer.tell() >= STDOUT_FLUSH_SIZE:
+            flush()
+
+    buffer.write("\n")
+    flush()
+
+    return "".join(parts)
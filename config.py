@@ -0,0 +1,64 @@
+import atexit
+import logging
+import os
+from functools import lru_cache
+
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq as AsyncGroqClient
+from groq import Groq as GroqClient
+from phi.model.groq import Groq
+
+
+load_dotenv()
+
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL_ID = os.getenv("GROQ_MODEL_ID", "llama-3.3-70b-versatile")
+CRAWL4AI_API_KEY = os.getenv("CRAWL4AI_API_KEY")
+
+GROQ_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+
+
+@lru_cache(maxsize=1)
+def get_groq_client() -> GroqClient:
+    """
+    Returns the process-wide Groq API client. All agents share its connection pool,
+    so the TCP/TLS handshake is paid once and later requests reuse keep-alive connections,
+    multiplexed over HTTP/2.
+    """
+    
+    http_client = httpx.Client(http2=True, limits=GROQ_HTTP_LIMITS)
+    atexit.register(http_client.close)
+    
+    return GroqClient(api_key=GROQ_API_KEY, http_client=http_client)
+
+
+@lru_cache(maxsize=1)
+def get_async_groq_client() -> AsyncGroqClient:
+    """
+    Returns the process-wide async Groq API client, used when agents run through `arun`.
+    Like the sync client, it keeps one pooled set of keep-alive connections for all agents.
+    """
+    
+    http_client = httpx.AsyncClient(http2=True, limits=GROQ_HTTP_LIMITS)
+    
+    return AsyncGroqClient(api_key=GROQ_API_KEY, http_client=http_client)
+
+
+@lru_cache(maxsize=4)
+def _get_base_groq_model(model_id: str) -> Groq:
+    return Groq(id=model_id, client=get_groq_client(), async_client=get_async_groq_client())
+
+
+def get_groq_model(model_id: str = GROQ_MODEL_ID) -> Groq:
+    """
+    Returns a Groq model for an agent's `model=`, built once per model id and then copied.
+    phi's Agent mutates its model (tools, functions, metrics...), so agents cannot share the
+    same object; a shallow copy with fresh metrics skips re-validation and client setup.
+    """
+    
+    return _get_base_groq_model(model_id).model_copy(update={"metrics": {}})
@@ -1,50 +1,152 @@
+import asyncio
 import logging
-import os
-from dotenv import load_dotenv
+import re
+import textwrap
+from collections import Counter
+from functools import lru_cache
 
+import tiktoken
 from phi.agent import Agent
-from phi.llm.groq import Groq
-from phi.tools.duckduckgo import DuckDuckGo
-from phi.tools.newspaper4k import Newspaper4k
 
+from agent_utils import batch_prompt, date_instruction, stream_to_stdout
+from config import GROQ_API_KEY, GROQ_MODEL_ID, get_groq_model
+from search_tools import CachedDuckDuckGo
+
+
+ARTICLE_MAX_TOKENS = 6000
+ARTICLE_TAIL_SUMMARY_SENTENCES = 3
+ARTICLE_CHARS_PER_TOKEN = 4
+
+# Only short lines that are nothing but the marker plus a few words ("Sign up for our newsletter"),
+# so real paragraphs that happen to start with these phrases are kept.
+BOILERPLATE_LINE_RE = re.compile(
+    r"^(advertisement|sponsored|subscribe|sign up|log in|share this|share on|follow us|read more|related articles?|recommended for you|we use cookies)\b.{0,40}$",
+    re.IGNORECASE,
+)
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+RESEARCH_AGENT_DESCRIPTION = textwrap.dedent("""
+    You are a senior NYT researcher tasked with writing an in-depth article
+    on a specific topic by researching and analyzing a key web source.
+""").strip()
+
+RESEARCH_AGENT_INSTRUCTIONS = (
+    "You are a senior NYT researcher. Your task is to write an article on a given topic.",
+    "1. For the given topic, use the DuckDuckGo tool to search for the top 1 most relevant and authoritative link. Prioritize reputable news sources or academic publications.",
+    "2. If DuckDuckGo returns no results or no suitable link, clearly state that you couldn't find a primary source and explain that you cannot proceed with writing the article based on web research.",
+    "3. If a link is found, use the Newspaper4k tool to read the URL and extract the full article text. Focus on the main content.",
+    "4. If Newspaper4k fails to extract the text (e.g., due to a paywall, non-article page, network error, or if the tool reports an error), clearly state this limitation. If possible, try to explain why it might have failed (e.g., 'The page might be behind a paywall or is not a standard article format.').",
+    "5. If the article text is successfully extracted, analyze its content thoroughly. Identify key facts, arguments, perspectives, and any notable quotes.",
+    "6. Based *solely* on the information from the successfully extracted article, prepare a comprehensive, well-structured, and engaging NYT-worthy article. Your tone should be objective and informative.",
+    "7. If you were unable to extract sufficient information from the web (either no link found or article unreadable), clearly state this and explain that a comprehensive article cannot be produced.",
+    "8. Ensure your final output is in Markdown format.",
+)
+
+
+def _summarize_text(text: str, num_sentences: int) -> str:
+    """Extractive summary: the sentences with the highest average word frequency, in original order."""
+    
+    sentences = [s.strip() for s in SENTENCE_END_RE.split(text) if s.strip()]
+    if len(sentences) <= num_sentences:
+        return " ".join(sentences)
 
-load_dotenv()
+    word_counts = Counter(w for w in re.findall(r"\w{4,}", text.lower()))
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    def score(sentence: str) -> float:
+        words = re.findall(r"\w{4,}", sentence.lower())
+        return sum(word_counts[w] for w in words) / len(words) if words else 0.0
 
-GROQ_MODEL_ID = os.getenv("GROQ_MODEL_ID", "llama-3.3-70b-versatile")
+    best = sorted(range(len(sentences)), key=lambda i: score(sentences[i]), reverse=True)[:num_sentences]
+    return " ".join(sentences[i] for i in sorted(best))
 
-def create_research_agent() -> Agent:
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> tiktoken.Encoding | None:
+    """Loads the tokenizer on first use; tiktoken may need to download it, so None when offline."""
+    
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    
+    except Exception as e:
+        logging.warning(f"Could not load tokenizer, capping articles by characters instead: {e}")
+        return None
+
+
+def trim_article_text(text: str, max_tokens: int = ARTICLE_MAX_TOKENS) -> str:
     """
-    Creates and configures the NYT researcher agent.
+    Drops boilerplate lines (ads, share/subscribe prompts...) and caps the text at `max_tokens`.
+    When text is cut, a short extractive summary of the removed tail is prepended.
     """
+    
+    text = "\n".join(
+        line for line in text.splitlines()
+        if line.strip() and not BOILERPLATE_LINE_RE.match(line.strip())
+    )
+
+    encoding = _get_encoding()
+    
+    if encoding is None:
+        max_chars = max_tokens * ARTICLE_CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        
+        head, tail = text[:max_chars], text[max_chars:]
+    
+    else:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        
+        head, tail = encoding.decode(tokens[:max_tokens]), encoding.decode(tokens[max_tokens:])
+
+    logging.info(f"Article text is longer than {max_tokens} tokens, truncating.")
+    
+    tail_summary = _summarize_text(tail, ARTICLE_TAIL_SUMMARY_SENTENCES)
+    
+    return f"[Summary of the truncated end of the article: {tail_summary}]\n\n{head}"
+
+
+def create_newspaper_tool():
+    """
+    Creates a Newspaper4k tool whose article text is cleaned and capped by `trim_article_text`.
+    Newspaper4k (newspaper, lxml...) is imported here rather than at module level, so the
+    import cost is only paid when the research agent is actually created.
+    """
+
+    from phi.tools.newspaper4k import Newspaper4k
 
-    duckduckgo_tool = DuckDuckGo()
     newspaper_tool = Newspaper4k()
+    get_article_data = newspaper_tool.get_article_data
 
-    agent_instructions = [
-        "You are a senior NYT researcher. Your task is to write an article on a given topic.",
-        "1. For the given topic, use the DuckDuckGo tool to search for the top 1 most relevant and authoritative link. Prioritize reputable news sources or academic publications.",
-        "2. If DuckDuckGo returns no results or no suitable link, clearly state that you couldn't find a primary source and explain that you cannot proceed with writing the article based on web research.",
-        "3. If a link is found, use the Newspaper4k tool to read the URL and extract the full article text. Focus on the main content.",
-        "4. If Newspaper4k fails to extract the text (e.g., due to a paywall, non-article page, network error, or if the tool reports an error), clearly state this limitation. If possible, try to explain why it might have failed (e.g., 'The page might be behind a paywall or is not a standard article format.').",
-        "5. If the article text is successfully extracted, analyze its content thoroughly. Identify key facts, arguments, perspectives, and any notable quotes.",
-        "6. Based *solely* on the information from the successfully extracted article, prepare a comprehensive, well-structured, and engaging NYT-worthy article. Your tone should be objective and informative.",
-        "7. If you were unable to extract sufficient information from the web (either no link found or article unreadable), clearly state this and explain that a comprehensive article cannot be produced.",
-        "8. Ensure your final output is in Markdown format.",
-    ]
+    def get_trimmed_article_data(url: str) -> dict | None:
+        article_data = get_article_data(url)
+        
+        if article_data and article_data.get("text"):
+            article_data["text"] = trim_article_text(article_data["text"])
+            
+        return article_data
+
+    newspaper_tool.get_article_data = get_trimmed_article_data
+    return newspaper_tool
+
+
+def create_research_agent() -> Agent:
+    """
+    Creates and configures the NYT researcher agent.
+    """
 
     try:
         
+        duckduckgo_tool = CachedDuckDuckGo()
+        newspaper_tool = create_newspaper_tool()
+        
         agent = Agent(
-            llm=Groq(model=GROQ_MODEL_ID),
+            model=get_groq_model(GROQ_MODEL_ID),
             tools=[duckduckgo_tool, newspaper_tool],
-            description="""You are a senior NYT researcher tasked with writing an in-depth article 
-                            on a specific topic by researching and analyzing a key web source.""",
-            instructions=agent_instructions,
+            description=RESEARCH_AGENT_DESCRIPTION,
+            instructions=[*RESEARCH_AGENT_INSTRUCTIONS, date_instruction()],
             markdown=True,     
             show_tool_calls=True, 
-            add_datetime_to_instructions=True,
         )
         
         logging.info(f"Agent created successfully with model: {GROQ_MODEL_ID}")
@@ -56,7 +158,7 @@ def create_research_agent() -> Agent:
 
 
 
-def generate_article_for_topic(topic: str, agent: Agent):
+async def generate_article_for_topic(topic: str, agent: Agent):
     """
     Uses the provided agent to generate an article for the given topic.
     Streams the response to the console.
@@ -70,7 +172,7 @@ def generate_article_for_topic(topic: str, agent: Agent):
     
     try:
         print(f"\n--- NYT Article on: {topic} ---\n")
-        agent.print_response(topic, stream=True)
+        await stream_to_stdout(agent, topic)
         logging.info(f"Successfully completed request for topic: '{topic}'")
         
     except Exception as e:
@@ -79,13 +181,44 @@ def generate_article_for_topic(topic: str, agent: Agent):
         print("Please check the logs and ensure your API keys and model configurations are correct.")
 
 
+async def generate_articles_for_topics(topics: list[str], agent: Agent):
+    """
+    Uses the provided agent to generate one article per topic in a single request.
+    Streaming is disabled since the full response has to be split into articles.
+    """
+    
+    if not agent:
+        logging.error("Agent not initialized. Cannot generate articles.")
+        return
+
+    logging.info(f"Attempting to generate articles for {len(topics)} topics: {topics}")
+    
+    try:
+        articles = await batch_prompt(
+            agent,
+            topics,
+            header=f"Produce {len(topics)} separate Markdown articles, one per topic, following your instructions for each topic.",
+        )
+        
+        for topic, article in zip(topics, articles):
+            print(f"\n--- NYT Article on: {topic} ---\n")
+            print(article or "[ERROR] The agent did not return an article for this topic.")
+            
+        logging.info(f"Successfully completed batched request for {len(topics)} topics.")
+        
+    except Exception as e:
+        logging.error(f"An error occurred while generating articles for {topics}: {e}")
+        print(f"\n[ERROR] Could not complete the batched article generation. Reason: {e}")
+        print("Please check the logs and ensure your API keys and model configurations are correct.")
+
+
 
-def main():
+async def main():
     """
     Main function to run the research agent.
     """
 
-    if not os.getenv("GROQ_API_KEY"):
+    if not GROQ_API_KEY:
         logging.error("GROQ_API_KEY not found in environment variables. Please set it in your .env file.")
         print("Error: GROQ_API_KEY is not set. Please create a .env file with GROQ_API_KEY='your_key'.")
         return
@@ -93,8 +226,13 @@ def main():
     try:
         research_agent = create_research_agent()
         
-        topic_to_research = "Simulation Theory"
-        generate_article_for_topic(topic_to_research, research_agent)
+        topics_to_research = ["Simulation Theory", "The Fermi Paradox"]
+        
+        # Several topics go out as one batched request; a single topic is streamed.
+        if len(topics_to_research) == 1:
+            await generate_article_for_topic(topics_to_research[0], research_agent)
+        else:
+            await generate_articles_for_topics(topics_to_research, research_agent)
 
     except Exception as e:
         logging.critical(f"A critical error occurred: {e}")
@@ -102,4 +240,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
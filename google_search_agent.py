@@ -1,19 +1,27 @@
+import asyncio
 import logging
-import os
-from dotenv import load_dotenv
 
 from phi.agent import Agent
-from phi.llm.groq import Groq
-from phi.tools.googlesearch import GoogleSearch
 
+from agent_utils import batch_prompt, date_instruction, stream_to_stdout
+from config import GROQ_API_KEY, GROQ_MODEL_ID, get_groq_model
+from search_tools import CachedGoogleSearch
 
-load_dotenv()
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-GROQ_MODEL_ID = os.getenv("GROQ_MODEL_ID", "llama-3.3-70b-versatile")
 NUM_NEWS_ITEMS_TO_FETCH = 2
 
+NEWS_AGENT_INSTRUCTIONS = (
+    "You are a web search agent specializing in finding the latest news.",
+    f"Given a topic by the user, your primary goal is to respond with the {NUM_NEWS_ITEMS_TO_FETCH} latest and most relevant news items about that topic.",
+    "1. Use the GoogleSearch tool to find news articles related to the provided topic. Explicitly aim to find recent publications.",
+    f"2. From the search results, carefully select the top {NUM_NEWS_ITEMS_TO_FETCH} unique and most recent news items. Ensure the items are distinct and not just rehashes of the same story from different minor outlets.",
+    "3. For each selected news item, provide a concise summary, the source (publication name), and the direct URL.",
+    "4. If the GoogleSearch tool fails to execute or returns no relevant results, clearly state that you were unable to find news on the topic and briefly explain (e.g., 'No recent news found' or 'Search tool error').",
+    f"5. If you find fewer than {NUM_NEWS_ITEMS_TO_FETCH} distinct and relevant news items (e.g., only 1), provide information for those you found and explicitly state that fewer items were available.",
+    "6. All searches and responses must be in English.",
+    "7. Present the final output in Markdown format, clearly listing each news item.",
+)
+
 
 def create_news_agent() -> Agent | None:
     """
@@ -21,30 +29,17 @@ def create_news_agent() -> Agent | None:
     Returns the Agent instance or None if creation fails.
     """
 
-    google_search_tool = GoogleSearch()
-
-    agent_instructions = [
-        f"You are a web search agent specializing in finding the latest news.",
-        f"Given a topic by the user, your primary goal is to respond with the {NUM_NEWS_ITEMS_TO_FETCH} latest and most relevant news items about that topic.",
-        "1. Use the GoogleSearch tool to find news articles related to the provided topic. Explicitly aim to find recent publications.",
-        f"2. From the search results, carefully select the top {NUM_NEWS_ITEMS_TO_FETCH} unique and most recent news items. Ensure the items are distinct and not just rehashes of the same story from different minor outlets.",
-        "3. For each selected news item, provide a concise summary, the source (publication name), and the direct URL.",
-        "4. If the GoogleSearch tool fails to execute or returns no relevant results, clearly state that you were unable to find news on the topic and briefly explain (e.g., 'No recent news found' or 'Search tool error').",
-        f"5. If you find fewer than {NUM_NEWS_ITEMS_TO_FETCH} distinct and relevant news items (e.g., only 1), provide information for those you found and explicitly state that fewer items were available.",
-        "6. All searches and responses must be in English.",
-        "7. Present the final output in Markdown format, clearly listing each news item.",
-    ]
+    google_search_tool = CachedGoogleSearch()
 
     try:
         
         agent = Agent(
-            llm=Groq(model=GROQ_MODEL_ID),
+            model=get_groq_model(GROQ_MODEL_ID),
             tools=[google_search_tool],
             description="You are a web search agent that helps users find the latest news information.",
-            instructions=agent_instructions,
+            instructions=[*NEWS_AGENT_INSTRUCTIONS, date_instruction()],
             show_tool_calls=True,
             markdown=True,
-            add_datetime_to_instructions=True,
         )
         
         logging.info(f"News agent created successfully with model: {GROQ_MODEL_ID}")
@@ -56,7 +51,7 @@ def create_news_agent() -> Agent | None:
         return None
 
 
-def fetch_and_display_news(topic: str, agent: Agent):
+async def fetch_and_display_news(topic: str, agent: Agent):
     """
     Uses the provided agent to fetch and display news for the given topic.
     Streams the response to the console.
@@ -72,7 +67,7 @@ def fetch_and_display_news(topic: str, agent: Agent):
     try:
         print(f"\n--- Latest News on: {topic} ---\n")
         
-        agent.print_response(topic, stream=True)
+        await stream_to_stdout(agent, topic)
         
         logging.info(f"Successfully completed news request for topic: '{topic}'")
         
@@ -82,13 +77,45 @@ def fetch_and_display_news(topic: str, agent: Agent):
         print("Please check your API keys (Groq, Google) and model configurations.")
 
 
+async def fetch_and_display_news_for_topics(topics: list[str], agent: Agent):
+    """
+    Uses the provided agent to fetch news for several topics in a single request.
+    Streaming is disabled since the full response has to be split per topic.
+    """
+    
+    if not agent:
+        logging.error("Agent not initialized. Cannot fetch news.")
+        print("[ERROR] Agent not available. Please check logs.")
+        return
 
-def main():
+    logging.info(f"Attempting to fetch news for {len(topics)} topics: {topics}")
+    
+    try:
+        news_sections = await batch_prompt(
+            agent,
+            topics,
+            header=f"Find the latest news for each of the following {len(topics)} topics, following your instructions for each topic.",
+        )
+        
+        for topic, news in zip(topics, news_sections):
+            print(f"\n--- Latest News on: {topic} ---\n")
+            print(news or "[ERROR] The agent did not return news for this topic.")
+        
+        logging.info(f"Successfully completed batched news request for {len(topics)} topics.")
+        
+    except Exception as e:
+        logging.error(f"An error occurred while fetching news for {topics}: {e}")
+        print(f"\n[ERROR] Could not complete the batched news fetching. Reason: {e}")
+        print("Please check your API keys (Groq, Google) and model configurations.")
+
+
+
+async def main():
     """
     Main function to run the news search agent.
     """
     
-    if not os.getenv("GROQ_API_KEY"):
+    if not GROQ_API_KEY:
         logging.error("GROQ_API_KEY not found in environment variables. Please set it in your .env file.")
         print("Error: GROQ_API_KEY is not set. Please create a .env file with GROQ_API_KEY='your_key'.")
         return
@@ -99,8 +126,16 @@ def main():
         print("Exiting due to agent creation failure.")
         return
 
-    topic_to_search = "latest developments in large language models (LLMs)"
-    fetch_and_display_news(topic_to_search, news_agent)
+    topics_to_search = [
+        "latest developments in large language models (LLMs)",
+        "latest developments in quantum computing",
+    ]
+    
+    # Several topics go out as one batched request; a single topic is streamed.
+    if len(topics_to_search) == 1:
+        await fetch_and_display_news(topics_to_search[0], news_agent)
+    else:
+        await fetch_and_display_news_for_topics(topics_to_search, news_agent)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
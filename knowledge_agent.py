@@ -1,27 +1,337 @@
+import asyncio
+import json
 import logging
+import math
 import os
-from dotenv import load_dotenv
-from typing import Any
-
-from phi.llm.groq import Groq
+import re
+import threading
+from functools import lru_cache
+from hashlib import md5
+from pathlib import Path
+from typing import Any, Iterator
+
+import tiktoken
 from phi.agent import Agent
-from phi.embedder.sentence_transformer import SentenceTransformerEmbedder
+from phi.embedder.base import Embedder
 from phi.vectordb.lancedb import LanceDb
 from phi.knowledge.text import TextKnowledgeBase
+from phi.document import Document
 
-load_dotenv()
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from agent_utils import batch_prompt, date_instruction, stream_to_stdout
+from config import GROQ_API_KEY, GROQ_MODEL_ID, get_groq_model
 
 
-GROQ_MODEL_ID = os.getenv("GROQ_MODEL_ID", "llama-3.3-70b-versatile")
 EMBEDDER_MODEL = "all-MiniLM-L6-v2"
+EMBEDDER_BATCH_SIZE = 64
 LANCEDB_URI = "tmp/lancedb_air_data"
 LANCEDB_TABLE_NAME = "air_quality_docs"
 AIR_TEXT_FILE_PATH = "./air.txt"
 
 FORCE_RECREATE_KB = False
 
+CHUNK_ENCODING = "cl100k_base"
+CHUNK_MAX_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 32
+CHUNK_CHARS_PER_TOKEN = 4
+
+LANCEDB_INDEX_MIN_ROWS = 1000
+LANCEDB_INDEX_SUB_VECTORS = 8
+LANCEDB_INDEX_NPROBES = 20
+
+FAST_ANSWER_MIN_SIMILARITY = 0.85
+
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+QUANTITY_QUESTION_RE = re.compile(
+    r"\b(how (much|many|long|old|far|hot|cold)|what (percentage|temperature)|kaç|ne kadar)\b",
+    re.IGNORECASE,
+)
+
+
+class BatchSentenceTransformerEmbedder(Embedder):
+    """
+    Sentence-transformers embedder that loads the model once and can embed many texts per call.
+    On CUDA the model runs in fp16; on CPU its Linear layers are dynamically quantized to int8.
+
+    torch and sentence_transformers are only imported when the model is first needed,
+    so importing this module (or running without a knowledge base) stays cheap.
+    """
+
+    model: str = EMBEDDER_MODEL
+    batch_size: int = EMBEDDER_BATCH_SIZE
+    sentence_transformer_client: Any = None
+
+    def _get_model(self) -> Any:
+        if self.sentence_transformer_client is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            model = SentenceTransformer(model_name_or_path=self.model, device=device)
+            
+            if device == "cuda":
+                model = model.half()
+            else:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            
+            logging.info(f"Embedder model loaded on {device}.")
+            self.sentence_transformer_client = model
+            
+        return self.sentence_transformer_client
+
+    def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._get_model().encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ).tolist()
+
+    def get_embedding(self, text: str) -> list[float]:
+        return self.get_embeddings([text])[0]
+
+    def get_embedding_and_usage(self, text: str) -> tuple[list[float], dict | None]:
+        return self.get_embedding(text), None
+
+
+class BatchLanceDb(LanceDb):
+    """LanceDb whose insert embeds all documents in one batched embedder call instead of one by one."""
+
+    def insert(self, documents: list[Document], filters: dict | None = None) -> None:
+        if self.table is None:
+            logging.error("LanceDB table not initialized. Cannot insert documents.")
+            return
+        
+        if not documents:
+            return
+
+        contents = [document.content.replace("\x00", "\ufffd") for document in documents]
+        embeddings = self.embedder.get_embeddings(contents)
+
+        # Same row layout as phi's LanceDb.insert, so its search methods keep working.
+        self.table.add([
+            {
+                "id": md5(content.encode()).hexdigest(),
+                "vector": embedding,
+                "payload": json.dumps({
+                    "name": document.name,
+                    "meta_data": document.meta_data,
+                    "content": content,
+                    "usage": document.usage,
+                }),
+            }
+            for document, content, embedding in zip(documents, contents, embeddings)
+        ])
+        
+        logging.info(f"Inserted {len(documents)} documents.")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> tiktoken.Encoding | None:
+    """Loads the tokenizer on first use; tiktoken may need to download it, so None when offline."""
+    
+    try:
+        return tiktoken.get_encoding(CHUNK_ENCODING)
+    
+    except Exception as e:
+        logging.warning(f"Could not load tokenizer, sizing chunks by characters instead: {e}")
+        return None
+
+
+def _split_sentence(sentence: str, max_tokens: int) -> list[tuple[str, int]]:
+    """
+    Returns the sentence as (text, token count) pieces of at most `max_tokens` tokens.
+    Without a tokenizer, tokens are estimated at CHUNK_CHARS_PER_TOKEN characters each.
+    """
+    
+    encoding = _get_encoding()
+    
+    if encoding is None:
+        max_chars = max_tokens * CHUNK_CHARS_PER_TOKEN
+        parts = [sentence[start:start + max_chars] for start in range(0, len(sentence), max_chars)]
+        return [(part, -(-len(part) // CHUNK_CHARS_PER_TOKEN)) for part in parts]
+    
+    tokens = encoding.encode(sentence)
+    if len(tokens) <= max_tokens:
+        return [(sentence, len(tokens))]
+    
+    return [
+        (encoding.decode(tokens[start:start + max_tokens]), len(tokens[start:start + max_tokens]))
+        for start in range(0, len(tokens), max_tokens)
+    ]
+
+
+def _document_id(document: Document) -> str:
+    """Content hash of a chunk, computed exactly like phi's LanceDb does for its `id` column."""
+    
+    return md5(document.content.replace("\x00", "\ufffd").encode()).hexdigest()
+
+
+class IncrementalTextKnowledgeBase(TextKnowledgeBase):
+    """
+    TextKnowledgeBase that chunks on sentence boundaries by token count, and on load
+    only embeds chunks whose content hash is not already stored in the vector db.
+    """
+
+    chunk_max_tokens: int = CHUNK_MAX_TOKENS
+    chunk_overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+
+    def chunk_text(self, text: str) -> list[str]:
+        """
+        Packs whole sentences into windows of at most `chunk_max_tokens` tokens, repeating
+        up to `chunk_overlap_tokens` tokens of trailing sentences at the start of the next window.
+        Sentences longer than a window are split on token count.
+        """
+        
+        pieces = []
+        for sentence in SENTENCE_BOUNDARY_RE.split(text):
+            sentence = sentence.strip()
+            if sentence:
+                pieces.extend(_split_sentence(sentence, self.chunk_max_tokens))
+
+        chunks = []
+        window, window_tokens = [], 0
+        
+        for piece, num_tokens in pieces:
+            
+            if window and window_tokens + num_tokens > self.chunk_max_tokens:
+                chunks.append(" ".join(p for p, _ in window))
+                
+                overlap, overlap_tokens = [], 0
+                for p, n in reversed(window):
+                    if overlap_tokens + n > self.chunk_overlap_tokens:
+                        break
+                    overlap.insert(0, (p, n))
+                    overlap_tokens += n
+                
+                if overlap_tokens + num_tokens > self.chunk_max_tokens:
+                    overlap, overlap_tokens = [], 0
+                
+                window, window_tokens = overlap, overlap_tokens
+            
+            window.append((piece, num_tokens))
+            window_tokens += num_tokens
+
+        if window:
+            chunks.append(" ".join(p for p, _ in window))
+
+        return chunks
+
+    @property
+    def document_lists(self) -> Iterator[list[Document]]:
+        path = Path(self.path)
+        files = sorted(f for f in path.glob("**/*") if f.suffix in self.formats) if path.is_dir() else [path]
+
+        for file in files:
+            if not file.is_file() or file.suffix not in self.formats:
+                continue
+            
+            logging.info(f"Reading: {file}")
+            yield [
+                Document(name=file.stem, id=f"{file.stem}_{i}", content=chunk, meta_data={"chunk": i})
+                for i, chunk in enumerate(self.chunk_text(file.read_text()), start=1)
+            ]
+
+    def _existing_ids(self, ids: list[str]) -> set[str]:
+        table = self.vector_db.table
+        if table is None or not ids:
+            return set()
+
+        id_list = ", ".join(f"'{doc_id}'" for doc_id in ids)
+        rows = table.search().where(f"id IN ({id_list})").limit(len(ids)).to_arrow()
+        
+        return set(rows["id"].to_pylist())
+
+    def load(self, recreate: bool = False, upsert: bool = False, skip_existing: bool = True, filters: dict | None = None) -> None:
+        if self.vector_db is None:
+            logging.warning("No vector db provided. Cannot load knowledge base.")
+            return
+
+        if recreate:
+            logging.info("Dropping existing knowledge base table.")
+            self.vector_db.drop()
+
+        # phi's create() does not re-open `table` after a drop, so the (shared) handle would
+        # keep pointing at the dropped table; open a fresh one instead.
+        if self.vector_db.table is None or not self.vector_db.exists():
+            self.vector_db.table = self.vector_db._init_table()
+
+        current_ids = set()
+
+        for document_list in self.document_lists:
+            document_ids = [_document_id(document) for document in document_list]
+            current_ids.update(document_ids)
+            
+            existing_ids = self._existing_ids(document_ids) if skip_existing else set()
+            new_documents = [document for document, doc_id in zip(document_list, document_ids) if doc_id not in existing_ids]
+
+            if new_documents:
+                self.vector_db.insert(documents=new_documents, filters=filters)
+
+            logging.info(f"Added {len(new_documents)} new chunks, {len(document_list) - len(new_documents)} already stored.")
+
+        self._delete_stale(current_ids)
+
+    def _delete_stale(self, current_ids: set[str]) -> None:
+        """Deletes stored chunks whose content is no longer produced by the source text."""
+        
+        num_rows = self.vector_db.get_count()
+        if num_rows <= len(current_ids):
+            return
+
+        if current_ids:
+            id_list = ", ".join(f"'{doc_id}'" for doc_id in current_ids)
+            self.vector_db.table.delete(f"id NOT IN ({id_list})")
+        else:
+            self.vector_db.table.delete("true")
+
+        logging.info(f"Removed {num_rows - self.vector_db.get_count()} stale chunks.")
+
+
+@lru_cache(maxsize=4)
+def get_embedder(embedder_model: str) -> BatchSentenceTransformerEmbedder:
+    """Returns a shared embedder per model name, so the model weights are only loaded once."""
+    
+    logging.info(f"Loading embedder model: {embedder_model}")
+    return BatchSentenceTransformerEmbedder(model=embedder_model)
+
+
+@lru_cache(maxsize=4)
+def get_vector_db(db_uri: str, table_name: str, embedder_model: str) -> BatchLanceDb:
+    """Returns a shared LanceDb handle per (uri, table, embedder model)."""
+    
+    return BatchLanceDb(
+        table_name=table_name,
+        uri=db_uri,
+        embedder=get_embedder(embedder_model),
+        nprobes=LANCEDB_INDEX_NPROBES,
+    )
+
+
+def ensure_vector_index(vector_db: LanceDb) -> None:
+    """
+    Builds an IVF-PQ index on the vector column once the table is large enough for
+    a flat scan to dominate query time. Does nothing if an index already exists.
+    """
+    
+    num_rows = vector_db.get_count()
+    if num_rows <= LANCEDB_INDEX_MIN_ROWS or vector_db.table is None:
+        return
+
+    if vector_db.table.list_indices():
+        return
+
+    logging.info(f"Building IVF-PQ index over {num_rows} vectors...")
+    
+    # Embeddings are L2-normalized, so L2 ranks exactly like cosine, and it is the
+    # metric phi's LanceDb queries with, which lets searches actually use the index.
+    vector_db.table.create_index(
+        metric="L2",
+        vector_column_name="vector",
+        num_partitions=int(math.sqrt(num_rows)),
+        num_sub_vectors=LANCEDB_INDEX_SUB_VECTORS,
+    )
+
 
 def create_knowledge_base(
     text_file_path: str,
@@ -55,14 +365,9 @@ def create_knowledge_base(
 
     try:
       
-        embedder = SentenceTransformerEmbedder(model=embedder_model)
-        vector_db = LanceDb(
-            table_name=table_name,
-            uri=db_uri,
-            embedder=embedder,
-        )
+        vector_db = get_vector_db(db_uri, table_name, embedder_model)
 
-        knowledge_base = TextKnowledgeBase(
+        knowledge_base = IncrementalTextKnowledgeBase(
             path=text_file_path,
             vector_db=vector_db,
         )
@@ -70,6 +375,7 @@ def create_knowledge_base(
         logging.info("Loading knowledge base into vector store...")
         
         knowledge_base.load(recreate=force_recreate)
+        ensure_vector_index(vector_db)
         
         logging.info("Knowledge base loaded successfully.")
         
@@ -80,6 +386,31 @@ def create_knowledge_base(
         return None
 
 
+_KB: IncrementalTextKnowledgeBase | None = None
+_KB_LOCK = threading.Lock()
+
+
+def get_kb() -> TextKnowledgeBase | None:
+    """
+    Returns the process-wide knowledge base built from the module settings,
+    creating and loading it on first use. Safe to call from multiple threads.
+    """
+    
+    global _KB
+    
+    with _KB_LOCK:
+        if _KB is None:
+            _KB = create_knowledge_base(
+                text_file_path=AIR_TEXT_FILE_PATH,
+                db_uri=LANCEDB_URI,
+                table_name=LANCEDB_TABLE_NAME,
+                embedder_model=EMBEDDER_MODEL,
+                force_recreate=FORCE_RECREATE_KB
+            )
+        
+        return _KB
+
+
 def create_rag_agent(
     llm_model_id: str,
     knowledge_base_instance: Any,
@@ -103,12 +434,12 @@ def create_rag_agent(
     try:
       
         agent = Agent(
-            llm=Groq(model=llm_model_id),
+            model=get_groq_model(llm_model_id),
             knowledge_base=knowledge_base_instance,
             description="You are a helpful AI assistant. You answer questions based on the provided knowledge about air quality and related topics. If the information is not in the knowledge base, say so.",
             show_tool_calls=show_tool_calls,
+            instructions=[date_instruction()],
             markdown=use_markdown,
-            add_datetime_to_instructions=True,
         )
         
         logging.info("RAG Agent created successfully.")
@@ -120,13 +451,53 @@ def create_rag_agent(
         return None
 
 
-def ask_agent(agent_instance: Agent, question: str):
+def fast_answer(knowledge_base: TextKnowledgeBase, question: str) -> str | None:
+    """
+    Returns the best matching chunk verbatim when it is close enough to the question
+    to be the answer by itself, so the LLM call can be skipped.
+
+    Args:
+        knowledge_base: The loaded knowledge base.
+        question: The question to answer.
+
+    Returns:
+        The chunk text, or None if the question should go to the agent.
+    """
+    
+    vector_db = knowledge_base.vector_db
+    if vector_db is None or vector_db.table is None:
+        return None
+
+    query_embedding = vector_db.embedder.get_embedding(question)
+    rows = vector_db.table.search(query_embedding, vector_column_name="vector").limit(1).to_list()
+    if not rows:
+        return None
+
+    # `_distance` is the squared L2 distance; for normalized embeddings it equals 2 - 2 * cosine.
+    similarity = 1 - rows[0]["_distance"] / 2
+    content = json.loads(rows[0]["payload"])["content"]
+    
+    logging.info(f"Top knowledge base match similarity: {similarity:.3f}")
+
+    if similarity < FAST_ANSWER_MIN_SIMILARITY:
+        return None
+
+    if QUANTITY_QUESTION_RE.search(question) and not re.search(r"\d", content):
+        return None
+
+    return content
+
+
+async def ask_agent(agent_instance: Agent, question: str, knowledge_base: TextKnowledgeBase | None = None):
     """
     Asks a question to the agent and prints the streamed response.
+    If a knowledge base is given and it holds a chunk that directly answers the
+    question, that chunk is printed instead and the LLM is not called.
 
     Args:
         agent_instance: The initialized Agent.
         question: The question to ask.
+        knowledge_base: Optional knowledge base used for the retrieval-only fast path.
     """
     
     if not agent_instance:
@@ -138,7 +509,15 @@ def ask_agent(agent_instance: Agent, question: str):
     print("\n--- Answer ---")
     
     try:
-        agent_instance.print_response(question, stream=True)
+        if knowledge_base:
+            answer = fast_answer(knowledge_base, question)
+            
+            if answer:
+                logging.info("Answered directly from the knowledge base, skipping the LLM.")
+                print(answer)
+                return
+        
+        await stream_to_stdout(agent_instance, question)
         
         logging.info("Agent responded successfully.")
         
@@ -148,27 +527,56 @@ def ask_agent(agent_instance: Agent, question: str):
         print(f"\n[ERROR] An error occurred while getting the answer: {e}")
 
 
+async def ask_agent_batch(agent_instance: Agent, questions: list[str]):
+    """
+    Asks several questions to the agent in a single request and prints each answer.
+
+    Args:
+        agent_instance: The initialized Agent.
+        questions: The questions to ask.
+    """
+    
+    if not agent_instance:
+        logging.error("Agent is not initialized. Cannot ask questions.")
+        return
+
+    logging.info(f"Asking agent {len(questions)} questions in one request.")
+    
+    try:
+        answers = await batch_prompt(
+            agent_instance,
+            questions,
+            header=f"Answer each of the following {len(questions)} questions using the knowledge base.",
+        )
+        
+        for question, answer in zip(questions, answers):
+            print(f"\n--- Question --- \n{question}")
+            print("\n--- Answer ---")
+            print(answer or "[ERROR] The agent did not return an answer for this question.")
+        
+        logging.info("Agent responded successfully.")
+        
+    except Exception as e:
+      
+        logging.error(f"Error during batched agent interaction: {e}", exc_info=True)
+        print(f"\n[ERROR] An error occurred while getting the answers: {e}")
+
 
-def main():
+
+async def main():
     """
     Main function to set up and run the RAG agent.
     """
 
 
-    if not os.getenv("GROQ_API_KEY"):
+    if not GROQ_API_KEY:
         error_msg = "GROQ_API_KEY not found in environment variables. Please set it in your .env file."
         logging.error(error_msg)
         print(f"Error: {error_msg}")
         
         return
 
-    knowledge = create_knowledge_base(
-        text_file_path=AIR_TEXT_FILE_PATH,
-        db_uri=LANCEDB_URI,
-        table_name=LANCEDB_TABLE_NAME,
-        embedder_model=EMBEDDER_MODEL,
-        force_recreate=FORCE_RECREATE_KB
-    )
+    knowledge = get_kb()
 
     if not knowledge:
         print("Failed to initialize knowledge base. Exiting.")
@@ -183,9 +591,14 @@ def main():
         print("Failed to initialize RAG agent. Exiting.")
         return
 
-    questions = "Istanbul hava sıcaklığı kaç derece?"
-    ask_agent(rag_agent, questions)
+    questions = ["Istanbul hava sıcaklığı kaç derece?", "Ankara hava sıcaklığı kaç derece?"]
+    
+    # Several questions go out as one batched request; a single one can use the retrieval-only fast path.
+    if len(questions) == 1:
+        await ask_agent(rag_agent, questions[0], knowledge_base=knowledge)
+    else:
+        await ask_agent_batch(rag_agent, questions)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -1,22 +1,192 @@
+import asyncio
+import atexit
+import json
 import logging
-import os
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlparse
 
 from phi.agent import Agent
-from phi.llm.groq import Groq
-from phi.tools.googlesearch import GoogleSearch
-from phi.tools.crawl4ai_tools import Crawl4aiTools
+from phi.tools import Toolkit
 
+from agent_utils import date_instruction, stream_to_stdout
+from config import CRAWL4AI_API_KEY, GROQ_API_KEY, GROQ_MODEL_ID, get_groq_model
+from search_tools import CachedGoogleSearch
 
-load_dotenv()
 
+CRAWL4AI_MAX_LENGTH = 2000
+NUM_LINKS_TO_FETCH = 3
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+WEB_SCRAPER_INSTRUCTIONS = (
+    "Always pass the full list of URLs to `scrape_all` in a single call instead of reading them one by one.",
+)
 
+TEAM_LEAD_INSTRUCTIONS = (
+    "You are the lead agent of a web research team. Your goal is to provide a comprehensive summary for a user's query.",
+    "1. The user's message contains the query and, under 'URLs to read', the URLs already selected for it.",
+    "2. You MUST pass the full URL list to the `WebScraper` agent and instruct it to read them in a single `scrape_all` call.",
+    f"3. Only if no URLs are listed, ask the `WebSearcher` agent for {NUM_LINKS_TO_FETCH} unique and relevant URLs for the query first, then pass them to the `WebScraper`. If it finds none, acknowledge this in your final summary.",
+    "4. If the `WebScraper` fails to read content from some or all URLs (e.g., due to errors, paywalls, or non-text content), acknowledge this. Your summary should be based on the content successfully scraped.",
+    "5. After receiving the scraped text from `WebScraper` (or an indication of failure), analyze all the gathered information.",
+    "6. Finally, provide a thoughtful, engaging, and well-structured summary of the findings in Markdown format. If no information could be gathered, clearly state that.",
+    "IMPORTANT: Do not try to use the tools of `WebScraper` or `WebSearcher` directly yourself.",
+)
 
-GROQ_MODEL_ID = os.getenv("GROQ_MODEL_ID", "llama-3.3-70b-versatile")
-CRAWL4AI_MAX_LENGTH = 2000
-NUM_LINKS_TO_FETCH = 3
+
+class BatchCrawl4aiTools(Toolkit):
+    """
+    Crawl4ai toolkit that scrapes a whole list of URLs concurrently in one tool call.
+
+    The crawler (and its headless browser) is kept open between calls on a dedicated
+    event loop thread. phi executes tool calls synchronously, possibly from inside a
+    running loop, so every crawler operation is submitted to that thread instead.
+
+    crawl4ai (and Playwright with it) is imported on construction rather than at module
+    level, so it is only loaded when a scraper agent is actually created.
+    """
+
+    def __init__(self, max_length: int | None = CRAWL4AI_MAX_LENGTH, max_concurrency: int = NUM_LINKS_TO_FETCH):
+        super().__init__(name="crawl4ai_tools")
+        
+        from crawl4ai import AsyncWebCrawler, CacheMode
+        
+        self._crawler_class = AsyncWebCrawler
+        self._cache_mode = CacheMode.BYPASS
+        
+        self.max_length = max_length
+        self.max_concurrency = max_concurrency
+        
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+        self._crawler: asyncio.Future | None = None
+        
+        self.register(self.scrape_all)
+
+    def _submit(self, coro) -> Future:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="crawl4ai-loop", daemon=True).start()
+                atexit.register(self.close)
+                
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _open_crawler(self):
+        crawler = self._crawler_class(thread_safe=True)
+        await crawler.__aenter__()
+        return crawler
+
+    async def _astart(self):
+        # Concurrent callers share the same pending start instead of each opening a browser.
+        if self._crawler is None:
+            self._crawler = asyncio.ensure_future(self._open_crawler())
+        
+        try:
+            return await self._crawler
+        except Exception:
+            self._crawler = None
+            raise
+
+    async def _aclose(self):
+        if self._crawler is not None:
+            crawler = await self._crawler
+            self._crawler = None
+            await crawler.__aexit__(None, None, None)
+
+    async def prewarm(self):
+        """Starts the crawler's browser ahead of the first scrape."""
+        
+        await asyncio.wrap_future(self._submit(self._astart()))
+        logging.info("Crawl4ai crawler is warmed up.")
+
+    def close(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+        
+        try:
+            self._submit(self._aclose()).result(timeout=10)
+        except Exception as e:
+            logging.warning(f"Failed to close Crawl4ai crawler cleanly: {e}")
+        
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def afetch(self, url: str, semaphore: asyncio.Semaphore) -> str:
+        crawler = await self._astart()
+        
+        async with semaphore:
+            result = await crawler.arun(url=url, cache_mode=self._cache_mode)
+
+        if not result.markdown:
+            return "No result"
+        
+        return result.markdown[:self.max_length] if self.max_length else result.markdown
+
+    async def ascrape_all(self, urls: list[str]) -> str:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pages = await asyncio.gather(*(self.afetch(url, semaphore) for url in urls), return_exceptions=True)
+
+        sections = []
+        for url, page in zip(urls, pages):
+            if isinstance(page, Exception):
+                logging.warning(f"Failed to scrape {url}: {page}")
+                page = f"Failed to read content: {page}"
+            sections.append(f"URL: {url}\n{page}")
+
+        return "\n\n---\n\n".join(sections)
+
+    def scrape_all(self, urls: list[str]) -> str:
+        """
+        Reads the main textual content of all the given URLs concurrently.
+
+        :param urls: The full list of URLs to read.
+
+        :return: The content of each URL, separated by '---'.
+        """
+        if not urls:
+            return "No URLs provided"
+
+        logging.info(f"Scraping {len(urls)} URLs concurrently...")
+        return self._submit(self.ascrape_all(urls)).result()
+
+
+def _find_crawl_tool(team: Agent) -> BatchCrawl4aiTools | None:
+    """Returns the batch crawl toolkit used by one of the team members, if any."""
+    
+    for member in team.team or []:
+        for tool in member.tools or []:
+            if isinstance(tool, BatchCrawl4aiTools):
+                return tool
+    return None
+
+
+def select_top_urls(query: str, count: int = NUM_LINKS_TO_FETCH) -> list[str]:
+    """
+    Searches Google for the query and returns up to `count` URLs, keeping only the
+    first result from each domain. Returns an empty list if the search fails.
+    """
+    
+    try:
+        results = json.loads(CachedGoogleSearch().google_search(query, max_results=count + 2))
+    except Exception as e:
+        logging.error(f"URL search failed for '{query}': {e}")
+        return []
+
+    urls, seen_domains = [], set()
+    for result in results:
+        url = result.get("url")
+        domain = urlparse(url).netloc.lower().removeprefix("www.") if url else None
+        
+        if not domain or domain in seen_domains:
+            continue
+        
+        seen_domains.add(domain)
+        urls.append(url)
+        
+        if len(urls) == count:
+            break
+
+    logging.info(f"Selected {len(urls)} URLs for '{query}': {urls}")
+    return urls
 
 
 def create_web_searcher_agent(llm_model_id: str) -> Agent | None:
@@ -27,12 +197,12 @@ def create_web_searcher_agent(llm_model_id: str) -> Agent | None:
     try:
         
         agent = Agent(
-            llm=Groq(model=llm_model_id),
+            model=get_groq_model(llm_model_id),
             name="WebSearcher",
             description="You are a specialized web search assistant. Your task is to find relevant URLs for a given query. Focus on providing diverse and high-quality links.",
-            tools=[GoogleSearch(num_results=NUM_LINKS_TO_FETCH + 2)],
+            instructions=[date_instruction()],
+            tools=[CachedGoogleSearch(fixed_max_results=NUM_LINKS_TO_FETCH + 2)],
             show_tool_calls=True,
-            add_datetime_to_instructions=True,
         )
         
         logging.info("Web Searcher agent created successfully.")
@@ -50,16 +220,19 @@ def create_web_scraper_agent(llm_model_id: str) -> Agent | None:
     
     logging.info("Creating Web Scraper agent...")
     
-    if not os.getenv("CRAWL4AI_API_KEY"):
+    if not CRAWL4AI_API_KEY:
         logging.error("CRAWL4AI_API_KEY not found in environment variables for Web Scraper.")
         return None
     try:
         
+        crawl_tool = BatchCrawl4aiTools(max_length=CRAWL4AI_MAX_LENGTH)
+        
         agent = Agent(
-            llm=Groq(model=llm_model_id),
+            model=get_groq_model(llm_model_id),
             name="WebScraper",
             description="You are a specialized web scraping assistant. Your task is to read and extract the main textual content from a list of provided URLs.",
-            tools=[Crawl4aiTools(max_length=CRAWL4AI_MAX_LENGTH, clean_html=True, use_semantic_extractor=True)],
+            instructions=WEB_SCRAPER_INSTRUCTIONS,
+            tools=[crawl_tool],
             show_tool_calls=True,
         )
         
@@ -83,30 +256,16 @@ def create_agent_team(
         logging.error("Cannot create agent team due to missing sub-agents.")
         return None
 
-    team_instructions = [
-        "You are the lead agent of a web research team. Your goal is to provide a comprehensive summary for a user's query.",
-        f"1. Receive the user's query. You MUST pass this query to the `WebSearcher` agent.",
-        f"2. Instruct the `WebSearcher` to search for the query and return {NUM_LINKS_TO_FETCH} unique and relevant URLs. Emphasize finding breaking news or very recent information if the query implies it.",
-        "3. If the `WebSearcher` fails to return any URLs or returns fewer than expected, acknowledge this in your final summary and explain the limitation.",
-        f"4. Once you have the URLs from `WebSearcher`, you MUST pass these URLs to the `WebScraper` agent.",
-        "5. Instruct the `WebScraper` to read the content from each of the provided URLs.",
-        "6. If the `WebScraper` fails to read content from some or all URLs (e.g., due to errors, paywalls, or non-text content), acknowledge this. Your summary should be based on the content successfully scraped.",
-        "7. After receiving the scraped text from `WebScraper` (or an indication of failure), analyze all the gathered information.",
-        "8. Finally, provide a thoughtful, engaging, and well-structured summary of the findings in Markdown format. If no information could be gathered, clearly state that.",
-        "IMPORTANT: You must explicitly call the `WebSearcher` first, then the `WebScraper` with the results from the searcher. Do not try to use their tools directly yourself."
-    ]
-
     try:
         
         agent_team = Agent(
-            llm=Groq(model=llm_model_id),
+            model=get_groq_model(llm_model_id),
             name="ResearchTeamLead",
             description="You are the leader of a web research team, coordinating a searcher and a scraper to answer user queries.",
             team=[searcher, scraper],
-            instructions=team_instructions,
+            instructions=[*TEAM_LEAD_INSTRUCTIONS, date_instruction()],
             show_tool_calls=True,
             markdown=True,
-            add_datetime_to_instructions=True,
         )
         
         logging.info("Agent Team created successfully.")
@@ -119,7 +278,7 @@ def create_agent_team(
 
 
 
-def run_team_task(team: Agent, query: str):
+async def run_team_task(team: Agent, query: str):
     """Runs the agent team to process a query and prints the response."""
     
     if not team:
@@ -131,8 +290,19 @@ def run_team_task(team: Agent, query: str):
     
     print(f"\n--- Team Task: {query} ---\n")
     
+    # Launch the scraper's browser while the URLs are being searched,
+    # so its cold start is off the critical path.
+    crawl_tool = _find_crawl_tool(team)
+    warmup = asyncio.create_task(crawl_tool.prewarm()) if crawl_tool else None
+    
     try:
-        team.print_response(query, stream=True)
+        urls = await asyncio.to_thread(select_top_urls, query)
+        
+        prompt = query
+        if urls:
+            prompt += "\n\nURLs to read:\n" + "\n".join(f"- {url}" for url in urls)
+        
+        await stream_to_stdout(team, prompt)
         
         logging.info(f"Agent team completed task for query: '{query}'")
         
@@ -140,14 +310,21 @@ def run_team_task(team: Agent, query: str):
         logging.error(f"An error occurred while the agent team was processing '{query}': {e}", exc_info=True)
         print(f"\n[ERROR] Could not complete the task for '{query}'. Reason: {e}")
         print("Please check API keys (Groq, Google, Crawl4AI) and configurations.")
+    
+    finally:
+        if warmup:
+            try:
+                await warmup
+            except Exception as e:
+                logging.warning(f"Crawl4ai warmup failed: {e}")
 
 
-def main():
+async def main():
     """
     Main function to set up and run the multi-agent system.
     """
 
-    if not os.getenv("GROQ_API_KEY"):
+    if not GROQ_API_KEY:
         error_msg = "GROQ_API_KEY not found in environment variables. Please set it in your .env file."
         logging.error(error_msg)
         print(f"Error: {error_msg}")
@@ -155,8 +332,15 @@ def main():
         return
 
 
-    web_searcher = create_web_searcher_agent(GROQ_MODEL_ID)
-    web_scraper = create_web_scraper_agent(GROQ_MODEL_ID)
+    # Build the shared Groq clients and base model first: lru_cache does not stop two
+    # threads from creating the same entry, which would give each agent its own pool.
+    get_groq_model(GROQ_MODEL_ID)
+
+    # The two sub-agents are independent, so build them concurrently.
+    web_searcher, web_scraper = await asyncio.gather(
+        asyncio.to_thread(create_web_searcher_agent, GROQ_MODEL_ID),
+        asyncio.to_thread(create_web_scraper_agent, GROQ_MODEL_ID),
+    )
 
     if not web_searcher or not web_scraper:
         print("Failed to create one or more sub-agents. Exiting.")
@@ -173,8 +357,8 @@ def main():
         return
 
     query = "What are the latest significant developments in AI ethics this month?"
-    run_team_task(agent_team, query)
+    await run_team_task(agent_team, query)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
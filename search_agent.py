@@ -1,112 +1,489 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import re
+import sys
+from string import Formatter
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from async_lru import alru_cache
 import ollama
 import requests
-from bs4 import BeautifulSoup
+import tiktoken
+from rank_bm25 import BM25Okapi
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 import trafilatura
+from trafilatura.settings import use_config
 import logging
 import sys_msgs
+from semantic_cache import semantic_cache
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+logger = logging.getLogger(__name__)
 
-OLLAMA_MODEL = 'gemma3:27b'
+# The large model only writes the final answer; the short decision calls (search or not,
+# query, result pick, relevance) go to a small quantized model.
+OLLAMA_MAIN_MODEL = 'gemma3:27b-it-q4_K_M'
+OLLAMA_DECISION_MODEL = 'gemma3:4b-it-q4_K_M'
 OLLAMA_REQUEST_TIMEOUT = 120
+OLLAMA_NUM_CTX = 8192
+OLLAMA_KEEP_ALIVE = '30m'
 DUCKDUCKGO_MAX_RESULTS = 5
 SEARCH_RETRY_LIMIT = 3
+RELEVANCE_MIN_CONFIDENCE = 0.5
+DECISION_MAX_TOKENS = 4
+RESULT_ID_MAX_TOKENS = 16
+QUERY_MAX_TOKENS = 32
+JSON_DECISION_MAX_TOKENS = 64
+DECISION_STOP = ('\n', '.')
+RELEVANCE_TOP_SENTENCES = 12
+RELEVANCE_MAX_TOKENS = 512
+RELEVANCE_CHARS_PER_TOKEN = 4
+CONTEXT_TOP_SENTENCES = 40
+CONTEXT_MAX_TOKENS = 1024
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+HTTP_TIMEOUT = (3.05, 10)
+DUCKDUCKGO_HTML_URL = 'https://html.duckduckgo.com/html/'
+SCRAPE_MAX_WORKERS = DUCKDUCKGO_MAX_RESULTS
+SCRAPE_DOWNLOAD_TIMEOUT = 8
+SCRAPE_MIN_OUTPUT_SIZE = 250
+SCRAPE_MAX_BYTES = 20_000_000
+STREAM_FLUSH_EVERY = 4
+QUERY_CACHE_MAX_ENTRIES = 512
+HISTORY_PATH = 'tmp/history.jsonl'
+HISTORY_WINDOW_SIZE = 16
+
+
+# Shared session so repeated searches reuse the open (keep-alive) connection
+# instead of paying a new TCP + TLS handshake every time.
+_SESSION = requests.Session()
+_SESSION.headers.update({'User-Agent': USER_AGENT})
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+))
+atexit.register(_SESSION.close)
+
+_TRAFILATURA_CONFIG = use_config()
+# Extractions shorter than this are dropped, so near-empty pages never reach the relevance check.
+_TRAFILATURA_CONFIG.set('DEFAULT', 'MIN_OUTPUT_SIZE', str(SCRAPE_MIN_OUTPUT_SIZE))
+_TRAFILATURA_CONFIG.set('DEFAULT', 'MAX_FILE_SIZE', str(SCRAPE_MAX_BYTES))
+_TRAFILATURA_CONFIG.set('DEFAULT', 'DOWNLOAD_TIMEOUT', str(SCRAPE_DOWNLOAD_TIMEOUT))
+
+_SCRAPE_EXECUTOR = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix='scrape')
+
+# One async client for every Ollama call, so LLM requests don't block the event loop
+# while searches and page downloads are in flight.
+_OLLAMA_CLIENT = ollama.AsyncClient()
+
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_WORD_RE = re.compile(r'\w+')
+_INTEGER_RE = re.compile(r'\d+')
+_TRUE_RE = re.compile(r'\btrue\b', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1)
+def _get_tokenizer() -> tiktoken.Encoding | None:
+    """Loads the tokenizer on first use; tiktoken may need to download it, so None when offline."""
+    
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer, capping passages by characters instead: {e}")
+        return None
+
 
+# Search queries already generated, keyed by a hash of the normalized user prompt.
+_QUERY_CACHE: OrderedDict[str, str] = OrderedDict()
+
+
+class ConversationStore:
+    """
+    Conversation history for the assistant. Every message is appended to a JSONL file on disk,
+    while only the last `window_size` messages are kept in memory and sent to Ollama.
+
+    When the window is full, its older half, extended to the next user message so only whole
+    turns go, is condensed by one summarization call into a system message that stands in for
+    the evicted turns. Evicting half at a time keeps the prefix sent to Ollama unchanged between
+    evictions, so its KV cache can still be reused.
+    """
 
-conversation_history = [sys_msgs.asistant_msg]
+    def __init__(self, system_message: dict, path: str = HISTORY_PATH, window_size: int = HISTORY_WINDOW_SIZE):
+        self.system_message = system_message
+        self.path = path
+        self.window: deque[dict] = deque(maxlen=window_size)
+        self.summary = ''
+        
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
 
+    def messages(self) -> list[dict]:
+        """The messages to send to the model: system prompt, summary of evicted turns, then the window."""
+        
+        messages = [self.system_message]
+        
+        if self.summary:
+            messages.append({'role': 'system', 'content': f"Summary of the earlier conversation: {self.summary}"})
+            
+        return messages + list(self.window)
 
+    async def append(self, message: dict):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(message, ensure_ascii=False) + '\n')
+                
+        except OSError as e:
+            logger.warning(f"Could not write message to {self.path}: {e}")
+        
+        if len(self.window) == self.window.maxlen:
+            evicted = [self.window.popleft() for _ in range(self.window.maxlen // 2)]
+            
+            # Never leave a search context or an answer in the window without its user message.
+            while self.window and self.window[0]['role'] != 'user':
+                evicted.append(self.window.popleft())
+                
+            await self._summarize(evicted)
+        
+        self.window.append(message)
 
-def _call_ollama_chat(system_prompt_template: str, user_data: dict, model: str = OLLAMA_MODEL) -> str | None:
+    async def _summarize(self, evicted: list[dict]):
+        logger.info(f"Summarizing {len(evicted)} older messages out of the conversation window...")
+        
+        transcript = "\n\n".join(f"{message['role'].upper()}: {message['content']}" for message in evicted)
+        
+        try:
+            response = await _OLLAMA_CLIENT.chat(
+                model=OLLAMA_DECISION_MODEL,
+                messages=[
+                    {'role': 'system', 'content': sys_msgs.summarize_msg},
+                    {'role': 'user', 'content': f"SUMMARY: {self.summary}\n\nMESSAGES:\n{transcript}"},
+                ],
+                options={"temperature": 0.1, "num_ctx": OLLAMA_NUM_CTX},
+                keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            self.summary = response['message']['content'].strip()
+            
+        except Exception as e:
+            # The evicted messages stay in the JSONL file; only the model loses them.
+            logger.warning(f"Failed to summarize the older conversation, dropping it from the context: {e}")
+
+
+conversation_store = ConversationStore(sys_msgs.asistant_msg)
+
+
+
+@lru_cache(maxsize=None)
+def _compile_template(template: str):
+    """
+    Parses a system prompt template once. Templates without fields are rendered right away
+    (only their escaped braces change), so later calls just return the stored string.
+    """
+    
+    if not any(field for _, field, _, _ in Formatter().parse(template)):
+        rendered = template.format()
+        return lambda user_data: rendered
+    
+    return template.format_map
+
+
+def _ollama_options(temperature: float, max_tokens: int | None, stop: tuple[str, ...]) -> dict:
+    """Builds the options of a helper call; max_tokens caps the decode length (num_predict)."""
+    
+    options = {"temperature": temperature, "num_ctx": OLLAMA_NUM_CTX}
+    
+    if max_tokens is not None:
+        options["num_predict"] = max_tokens
+    if stop:
+        options["stop"] = list(stop)
+        
+    return options
+
+
+@alru_cache(maxsize=1024)
+async def _cached_chat(
+    model: str,
+    system_prompt_template: str,
+    user_data_json: str,
+    response_format: str | None = None,
+    max_tokens: int | None = None,
+    stop: tuple[str, ...] = ()) -> str:
+    """
+    Calls the Ollama chat API for `_call_ollama_chat`. Takes hashable arguments so identical
+    calls are answered from the cache; errors are raised rather than returned, so they are never cached.
+    """
+    
+    user_data = json.loads(user_data_json)
+    
+    system_message_content = _compile_template(system_prompt_template)(user_data)
+    messages = [{'role': 'system', 'content': system_message_content}]
+    
+    if "user_prompt_for_llm" in user_data:
+         messages.append({'role': 'user', 'content': user_data["user_prompt_for_llm"]})
+
+    logger.debug("Calling Ollama with model %s. Messages: %s", model, messages)
+    
+    response = await _OLLAMA_CLIENT.chat(
+        model=model,
+        messages=messages,
+        options=_ollama_options(0.3, max_tokens, stop),
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        format=response_format or '',
+        #stream=False
+        #timeout=OLLAMA_REQUEST_TIMEOUT
+    )
+    
+    return response['message']['content']
+
+
+@alru_cache(maxsize=1024)
+@semantic_cache(
+    namespace=lambda model, system_prompt, role, content, *_: f"decide\n{model}\n{system_prompt}",
+    text=lambda model, system_prompt, role, content, *_: content,
+)
+async def _cached_decide(
+    model: str,
+    system_prompt: str,
+    role: str,
+    content: str,
+    max_tokens: int | None = None,
+    stop: tuple[str, ...] = ()) -> str:
+    """
+    Calls the Ollama chat API for `_call_ollama_decide`, cached like `_cached_chat`. Yes/no decisions
+    are also looked up by similarity, so rephrasings of an earlier prompt reuse its answer.
+    """
+    
+    messages=[
+        {'role': 'system', 'content': system_prompt},
+        {'role': role, 'content': content}
+    ]
+    
+    logger.debug("Calling Ollama (decide) with model %s. Messages: %s", model, messages)
+    
+    response = await _OLLAMA_CLIENT.chat(
+        model=model,
+        messages=messages,
+        options=_ollama_options(0.1, max_tokens, stop),
+        keep_alive=OLLAMA_KEEP_ALIVE,
+    )
+    
+    return response['message']['content']
+
+
+async def _call_ollama_chat(
+    system_prompt_template: str,
+    user_data: dict,
+    model: str = OLLAMA_DECISION_MODEL,
+    response_format: str | None = None,
+    max_tokens: int | None = None,
+    stop: tuple[str, ...] = ()) -> str | None:
     """
     Helper function to call the Ollama chat API and extract content.
-    Formats the system prompt with user_data.
+    Formats the system prompt with user_data. Pass response_format='json' to make Ollama emit valid JSON,
+    and max_tokens / stop to cut the answer short once the expected output is complete.
     """
     
     try:
       
-        system_message_content = system_prompt_template.format(**user_data)
-        messages = [{'role': 'system', 'content': system_message_content}]
-        
-        if "user_prompt_for_llm" in user_data:
-             messages.append({'role': 'user', 'content': user_data["user_prompt_for_llm"]})
-
-        logging.debug(f"Calling Ollama with model {model}. Messages: {messages}")
-        
-        response = ollama.chat(
-            model=model,
-            messages=messages,
-            options={"temperature": 0.3},
-            #stream=False
-            #timeout=OLLAMA_REQUEST_TIMEOUT
+        content = await _cached_chat(
+            model,
+            system_prompt_template,
+            json.dumps(user_data, sort_keys=True),
+            response_format,
+            max_tokens,
+            stop,
         )
         
-        content = response['message']['content']
-        
-        logging.debug(f"Ollama response content: {content}")
+        logger.debug("Ollama response content: %s", content)
+        logger.debug("Chat cache: %s", _cached_chat.cache_info())
         
         return content
       
     except Exception as e:
-        logging.error(f"Error calling Ollama: {e}", exc_info=True)
+        logger.error(f"Error calling Ollama: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
         return None
 
 
-def _call_ollama_decide(system_prompt: str, last_user_message: dict, model: str = OLLAMA_MODEL) -> str | None:
-    """Helper specifically for decision-making prompts (e.g. search_or_not, contains_data)."""
+async def _call_ollama_decide(
+    system_prompt: str,
+    last_user_message: dict,
+    model: str = OLLAMA_DECISION_MODEL,
+    max_tokens: int | None = None,
+    stop: tuple[str, ...] = ()) -> str | None:
+    """Helper specifically for decision-making prompts (e.g. search_or_not)."""
     
     try:
       
-        messages=[
-            {'role': 'system', 'content': system_prompt},
-            last_user_message
-        ]
-        
-        logging.debug(f"Calling Ollama (decide) with model {model}. Messages: {messages}")
-        
-        response = ollama.chat(model=model, messages=messages, options={"temperature": 0.1})
-        content = response['message']['content']
+        content = await _cached_decide(
+            model,
+            system_prompt,
+            last_user_message['role'],
+            last_user_message['content'],
+            max_tokens,
+            stop,
+        )
         
-        logging.debug(f"Ollama decision response: {content}")
+        logger.debug("Ollama decision response: %s", content)
+        logger.debug("Decision cache: %s", _cached_decide.cache_info())
         
         return content
       
     except Exception as e:
-        logging.error(f"Error calling Ollama for decision: {e}", exc_info=True)
+        logger.error(f"Error calling Ollama for decision: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+        return None
+
+
+
+def _parse_json_response(content: str | None) -> dict | None:
+    """Parses a JSON object answer from the LLM, or returns None if it is not one."""
+    
+    if not content:
         return None
+    
+    try:
+        parsed = json.loads(content)
+    except json.JSONDecodeError:
+        logger.warning(f"LLM did not return valid JSON: '{content}'")
+        return None
+    
+    return parsed if isinstance(parsed, dict) else None
+
+
+@semantic_cache(
+    namespace=lambda user_prompt: f"decide_and_query\n{OLLAMA_DECISION_MODEL}\n{sys_msgs.decide_and_query_msg}",
+    text=lambda user_prompt: user_prompt,
+    keep=lambda decision: not decision["need_search"],
+)
+async def _decide_and_query(user_prompt: str) -> dict | None:
+    """
+    Decides whether the prompt needs a web search and generates the search query in a
+    single LLM call. Returns {"need_search": bool, "query": str}, or None if the call
+    failed or did not return the expected JSON.
+
+    Only "no search" answers are kept in the semantic cache: a generated query is specific
+    to its prompt (another city or ticker), so it is never reused for a similar one.
+    """
+    
+    logger.info("Deciding whether to search the web and generating the query...")
+    
+    content = await _call_ollama_chat(
+        sys_msgs.decide_and_query_msg,
+        {"user_prompt_for_llm": user_prompt},
+        response_format='json',
+        max_tokens=JSON_DECISION_MAX_TOKENS,
+    )
+    
+    decision = _parse_json_response(content)
+    if decision is None or not isinstance(decision.get("need_search"), bool):
+        logger.warning(f"Unexpected search decision response: '{content}'")
+        return None
+    
+    query = decision.get("query")
+    decision["query"] = query.strip().strip('"\'') if isinstance(query, str) else ""
+    
+    logger.info(f"Decision to search: {decision['need_search']}, query: '{decision['query']}'")
+    
+    return decision
+
 
+def _query_cache_key(user_prompt: str) -> str:
+    return hashlib.blake2b(user_prompt.strip().lower().encode(), digest_size=16).hexdigest()
+
+
+def _get_cached_query(user_prompt: str) -> str | None:
+    key = _query_cache_key(user_prompt)
+    
+    query = _QUERY_CACHE.get(key)
+    if query is not None:
+        _QUERY_CACHE.move_to_end(key)
+        logger.info(f"Reusing search query generated earlier: {query}")
+        
+    return query
+
+
+def _cache_query(user_prompt: str, query: str):
+    _QUERY_CACHE[_query_cache_key(user_prompt)] = query
+    
+    if len(_QUERY_CACHE) > QUERY_CACHE_MAX_ENTRIES:
+        _QUERY_CACHE.popitem(last=False)
 
 
-def should_search_web(conversation_history: str) -> bool:
+async def decide_search_query(conversation_history: list[dict]) -> str | None:
+    """
+    Returns the search query to run for the last user message, or None if no search is needed.
+    Uses the single fused decision call, and falls back to separate decision and query calls
+    only when its answer cannot be used.
+    """
+    
+    if not conversation_history or conversation_history[-1]['role'] != 'user':
+        logger.warning("Cannot decide to search without a preceding user message in history.")
+        return None
+    
+    last_user_prompt_content = conversation_history[-1]['content']
+    
+    # A prompt a query was already generated for (up to case and whitespace) needs no new decision.
+    cached_query = _get_cached_query(last_user_prompt_content)
+    if cached_query:
+        return cached_query
+    
+    decision = await _decide_and_query(last_user_prompt_content)
+    if decision is not None:
+        if not decision["need_search"]:
+            return None
+        if decision["query"]:
+            _cache_query(last_user_prompt_content, decision["query"])
+            return decision["query"]
+    
+    elif not await should_search_web(conversation_history):
+        return None
+    
+    return await generate_search_query(last_user_prompt_content)
+
+
+async def should_search_web(conversation_history: list[dict]) -> bool:
     """Determines if a web search is needed based on the user's prompt."""
     
-    logging.info("Deciding whether to search the web...")
+    logger.info("Deciding whether to search the web...")
 
     if not conversation_history or conversation_history[-1]['role'] != 'user':
-        logging.warning("Cannot decide to search without a preceding user message in history.")
+        logger.warning("Cannot decide to search without a preceding user message in history.")
         return False
     
     last_user_message = conversation_history[-1]
 
-    content = _call_ollama_decide(sys_msgs.search_or_not_msg, last_user_message)
+    content = await _call_ollama_decide(
+        sys_msgs.search_or_not_msg,
+        last_user_message,
+        max_tokens=DECISION_MAX_TOKENS,
+        stop=DECISION_STOP,
+    )
     
-    decision = content and 'true' in content.lower()
+    decision = bool(content and _TRUE_RE.search(content))
     
-    logging.info(f"Decision to search: {decision}")
+    logger.info(f"Decision to search: {decision}")
     
     return decision
 
 
-def generate_search_query(last_user_prompt_content: str) -> str | None:
+async def generate_search_query(last_user_prompt_content: str) -> str | None:
     """Generates a search query from the user's prompt."""
     
-    logging.info("Generating search query...")
+    cached_query = _get_cached_query(last_user_prompt_content)
+    if cached_query:
+        return cached_query
+    
+    logger.info("Generating search query...")
     
     user_data_for_llm = {"user_prompt_for_llm": f"CREATE A SEARCH QUERY FOR THIS PROMPT: \n{last_user_prompt_content}"}
 
-    query = _call_ollama_chat(sys_msgs.query_msg, user_data_for_llm)
+    query = await _call_ollama_chat(sys_msgs.query_msg, user_data_for_llm, max_tokens=QUERY_MAX_TOKENS, stop=('\n',))
 
     if query:
 
@@ -116,10 +493,11 @@ def generate_search_query(last_user_prompt_content: str) -> str | None:
         if query.startswith("'") and query.endswith("'"):
             query = query[1:-1]
             
-        logging.info(f"Generated search query: {query}")
+        _cache_query(last_user_prompt_content, query)
+        logger.info(f"Generated search query: {query}")
         
     else:
-        logging.warning("Failed to generate search query.")
+        logger.warning("Failed to generate search query.")
         
     return query
 
@@ -127,35 +505,30 @@ def generate_search_query(last_user_prompt_content: str) -> str | None:
 def perform_duckduckgo_search(query: str) -> list[dict]:
     """Performs a DuckDuckGo search and returns formatted results."""
     
-    logging.info(f"Performing DuckDuckGo search for: {query}")
-    
-    headers = {'User-Agent': USER_AGENT}
-    url = f"https://html.duckduckgo.com/html/?q={query}"
+    logger.info(f"Performing DuckDuckGo search for: {query}")
     
     try:
-        response = requests.get(url=url, headers=headers, timeout=10)
+        response = _SESSION.get(DUCKDUCKGO_HTML_URL, params={'q': query}, timeout=HTTP_TIMEOUT)
         response.raise_for_status()
         
     except requests.exceptions.RequestException as e:
-        logging.error(f"DuckDuckGo search request failed: {e}")
+        logger.error(f"DuckDuckGo search request failed: {e}")
         return []
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    tree = LexborHTMLParser(response.text)
     results = []
     
-    for i, result_div in enumerate(soup.find_all('div', class_='result')):
-        if i >= DUCKDUCKGO_MAX_RESULTS:
-            break
+    for i, result_div in enumerate(tree.css('div.result')[:DUCKDUCKGO_MAX_RESULTS]):
         
-        title_tag = result_div.find('a', class_='result__a')
-        if not title_tag or not title_tag.get('href'):
+        title_tag = result_div.css_first('a.result__a')
+        link = title_tag.attributes.get('href') if title_tag else None
+        if not link:
             continue
         
-        link = title_tag['href']
-        title = title_tag.text.strip()
+        title = title_tag.text().strip()
         
-        snippet_tag = result_div.find('a', class_='result__snippet')
-        snippet = snippet_tag.text.strip() if snippet_tag else 'No description available.'
+        snippet_tag = result_div.css_first('a.result__snippet')
+        snippet = snippet_tag.text().strip() if snippet_tag else 'No description available.'
         
         results.append({
             'id': i,
@@ -164,19 +537,19 @@ def perform_duckduckgo_search(query: str) -> list[dict]:
             'snippet': snippet
         })
     
-    logging.info(f"Found {len(results)} search results.")
-    logging.debug(f"Search results: {results}")
+    logger.info(f"Found {len(results)} search results.")
+    logger.debug("Search results: %s", results)
     
     return results
 
-def select_best_search_result_id(search_results: list[dict], user_prompt_content: str, generated_query: str) -> int | None:
-    """Asks the LLM to select the best search result ID."""
+async def select_best_search_result_id(search_results: list[dict], user_prompt_content: str, generated_query: str) -> int | None:
+    """Asks the LLM to select the best search result, and returns its 'id'."""
     
     if not search_results:
-        logging.warning("No search results to select from.")
+        logger.warning("No search results to select from.")
         return None
 
-    logging.info("Selecting the best search result...")
+    logger.info("Selecting the best search result...")
     
     formatted_s_results = "\n".join([
         f"ID: {res['id']}\nTitle: {res['title']}\nLink: {res['link']}\nSnippet: {res['snippet']}\n---"
@@ -185,200 +558,276 @@ def select_best_search_result_id(search_results: list[dict], user_prompt_content
 
 
     user_data = {
-        "s_results": formatted_s_results,
-        "user_prompt": user_prompt_content,
-        "search_query": generated_query
+        "user_prompt_for_llm": (
+            f"SEARCH_RESULTS:\n{formatted_s_results}\n"
+            f"USER_PROMPT: {user_prompt_content}\n"
+            f"SEARCH_QUERY: {generated_query}"
+        )
     }
 
-    for attempt in range(SEARCH_RETRY_LIMIT):
-      
-        logging.debug(f"Attempt {attempt + 1} to select best result.")
-        
-        content = _call_ollama_chat(sys_msgs.best_search_msg, user_data)
-        if content:
-            try:
-              
-                best_id = int(content)
-                if 0 <= best_id < len(search_results):
-                    logging.info(f"Selected best search result ID: {best_id}")
-                    return best_id
-                  
-                else:
-                    logging.warning(f"LLM returned out-of-bounds ID: {best_id}. Results count: {len(search_results)}")
-            
-            except ValueError:
-                logging.warning(f"LLM did not return a valid integer ID: '{content}'")
-
+    # JSON mode makes the answer parseable on the first try, so there is no retry loop.
+    content = await _call_ollama_chat(
+        sys_msgs.best_search_msg,
+        user_data,
+        response_format='json',
+        max_tokens=RESULT_ID_MAX_TOKENS,
+    )
+    if not content:
+        logger.error("Failed to select a best search result.")
+        return None
     
-    logging.error("Failed to select a best search result after multiple attempts.")
-    return None
+    best_id = (_parse_json_response(content) or {}).get("id")
+    
+    if not isinstance(best_id, int):
+        match = _INTEGER_RE.search(content)
+        best_id = int(match.group()) if match else None
+    
+    if best_id is None:
+        logger.warning(f"LLM did not return a valid integer ID: '{content}'")
+        return None
+    
+    if best_id not in {res['id'] for res in search_results}:
+        logger.warning(f"LLM returned an unknown ID: {best_id}. Available IDs: {[res['id'] for res in search_results]}")
+        return None
+    
+    logger.info(f"Selected best search result ID: {best_id}")
+    return best_id
 
 
 def scrape_webpage_content(url: str) -> str | None:
     """Scrapes the main content of a webpage using Trafilatura."""
     
-    logging.info(f"Scraping webpage: {url}")
+    logger.info(f"Scraping webpage: {url}")
     
     try:
       
-        downloaded = trafilatura.fetch_url(url)
+        # trafilatura's fetcher reuses its connection pool and keeps its safeguards: a redirect
+        # limit, no private or loopback addresses, and the MAX_FILE_SIZE cap.
+        downloaded = trafilatura.fetch_url(url, config=_TRAFILATURA_CONFIG)
         if downloaded is None:
-            logging.warning(f"Failed to download content from {url}.")
+            logger.warning(f"Failed to download content from {url}.")
             return None
           
-        content = trafilatura.extract(downloaded, include_formatting=False, include_links=False)
+        # Only the plain main text is used, so skip comments, tables and the
+        # readability/justext fallbacks, which make up most of the extraction time.
+        content = trafilatura.extract(
+            downloaded,
+            include_comments=False,
+            include_tables=False,
+            include_formatting=False,
+            include_links=False,
+            fast=True,
+            favor_precision=True,
+            config=_TRAFILATURA_CONFIG,
+        )
         
         if content:
-            logging.info(f"Successfully scraped content (length: {len(content)}).")
+            logger.info(f"Successfully scraped content (length: {len(content)}).")
             return content
           
         else:
-            logging.warning(f"Trafilatura extracted no main content from {url}.")
+            logger.warning(f"Trafilatura extracted no main content from {url}.")
             return None
           
     except Exception as e:
-        logging.error(f"Error scraping webpage {url}: {e}", exc_info=True)
+        logger.error(f"Error scraping webpage {url}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
         return None
 
 
-def is_content_relevant(page_text: str, user_prompt_content: str, generated_query: str) -> bool:
-    """Asks the LLM to determine if the scraped content is relevant."""
-    logging.info("Checking if scraped content is relevant...")
+def select_relevant_passage(page_text: str, query: str, top_k: int = RELEVANCE_TOP_SENTENCES, max_tokens: int = RELEVANCE_MAX_TOKENS) -> str:
+    """
+    Keeps the `top_k` sentences of the page that best match the query (BM25), in page order,
+    capped at `max_tokens` tokens. Enough for a relevance decision at a fraction of the prefill.
+    """
+    
+    sentences = [sentence for sentence in _SENTENCE_SPLIT_RE.split(page_text) if _WORD_RE.search(sentence)]
+    if not sentences:
+        return ""
+    
+    bm25 = BM25Okapi([_WORD_RE.findall(sentence.lower()) for sentence in sentences])
+    scores = bm25.get_scores(_WORD_RE.findall(query.lower()))
+    
+    best = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)[:top_k]
+    passage = " ".join(sentences[i] for i in sorted(best))
+    
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        max_chars = max_tokens * RELEVANCE_CHARS_PER_TOKEN
+        return passage[:max_chars] + "..." if len(passage) > max_chars else passage
+    
+    tokens = tokenizer.encode(passage)
+    if len(tokens) > max_tokens:
+        passage = tokenizer.decode(tokens[:max_tokens]) + "..."
+        
+    return passage
 
-    max_text_len = 8000
-    truncated_page_text = page_text[:max_text_len] + ("..." if len(page_text) > max_text_len else "")
+
+async def is_content_relevant(page_text: str, user_prompt_content: str, generated_query: str) -> bool:
+    """
+    Asks the LLM to determine if the scraped content is relevant. The LLM answers with
+    {"relevant": bool, "confidence": float}; the page counts as relevant when it says so
+    with at least RELEVANCE_MIN_CONFIDENCE.
+    """
+    logger.info("Checking if scraped content is relevant...")
+
+    truncated_page_text = select_relevant_passage(page_text, generated_query)
 
     user_data = {
-        "page_text": truncated_page_text,
-        "user_prompt": user_prompt_content,
-        "search_query": generated_query
+        "user_prompt_for_llm": (
+            f"PAGE_TEXT: {truncated_page_text}\n"
+            f"USER_PROMPT: {user_prompt_content}\n"
+            f"SEARCH_QUERY: {generated_query}"
+        )
     }
     
-    content = _call_ollama_chat(sys_msgs.contains_data_msg, user_data)
+    content = await _call_ollama_chat(
+        sys_msgs.page_relevance_msg,
+        user_data,
+        response_format='json',
+        max_tokens=JSON_DECISION_MAX_TOKENS,
+    )
+    result = _parse_json_response(content) or {}
     
-    decision = content and 'true' in content.lower()
+    confidence = result.get("confidence")
+    confidence = float(confidence) if isinstance(confidence, (int, float)) else 1.0
     
-    logging.info(f"Content relevance decision: {decision}")
+    decision = result.get("relevant") is True and confidence >= RELEVANCE_MIN_CONFIDENCE
+    
+    logger.info(f"Content relevance decision: {decision} (confidence: {confidence})")
     
     return decision
 
-def run_ai_search_pipeline(last_user_prompt_content: str) -> str | None:
-    """Orchestrates the AI search pipeline."""
+async def run_ai_search_pipeline(last_user_prompt_content: str, generated_query: str | None = None) -> str | None:
+    """Orchestrates the AI search pipeline. The search query is generated unless one is given."""
+    
+    logger.info("--- Starting AI Search Pipeline ---")
     
-    logging.info("--- Starting AI Search Pipeline ---")
+    if not generated_query:
+        generated_query = await generate_search_query(last_user_prompt_content)
     
-    generated_query = generate_search_query(last_user_prompt_content)
     if not generated_query:
-        logging.warning("Pipeline aborted: Failed to generate search query.")
+        logger.warning("Pipeline aborted: Failed to generate search query.")
         return None
 
-    search_results_list = perform_duckduckgo_search(generated_query)
+    search_results_list = await asyncio.to_thread(perform_duckduckgo_search, generated_query)
     if not search_results_list:
-        logging.warning("Pipeline aborted: No search results found.")
+        logger.warning("Pipeline aborted: No search results found.")
         return None
     
+    # Start scraping every candidate right away; the downloads of the next candidates
+    # overlap with the LLM deciding on the current one.
+    scrape_futures = {
+        result['id']: asyncio.wrap_future(_SCRAPE_EXECUTOR.submit(scrape_webpage_content, result['link']))
+        for result in search_results_list
+    }
+    
+    try:
+        return await _try_search_results(search_results_list, scrape_futures, last_user_prompt_content, generated_query)
+    
+    finally:
+        for future in scrape_futures.values():
+            future.cancel()
+
+
+async def _try_search_results(search_results_list: list[dict], scrape_futures: dict, last_user_prompt_content: str, generated_query: str) -> str | None:
+    """
+    Tries the search results until one has relevant content. The top-ranked result is checked
+    first without asking the LLM to pick one; the LLM only ranks the rest if it is not relevant.
+    """
+    
     available_results = list(search_results_list) 
 
-    for _ in range(min(len(available_results), SEARCH_RETRY_LIMIT)):
+    for attempt in range(min(len(available_results), SEARCH_RETRY_LIMIT)):
       
         if not available_results:
-            logging.info("No more search results to try.")
+            logger.info("No more search results to try.")
             break
 
-        best_result_id = select_best_search_result_id(
+        best_result_id = available_results[0]['id'] if attempt == 0 else await select_best_search_result_id(
             available_results,
             last_user_prompt_content,
             generated_query
         )
         
-        if best_result_id is None:
-            logging.warning("Could not select a best result from remaining items. Trying next if available, or aborting.")
-            
-            if not available_results:
-              break
-            
-            selected_result_details = available_results.pop(0)
-            
-            logging.warning(f"Falling back to trying result ID 0 from remaining: {selected_result_details['link']}")
-            
-        else:
-          
-            try:
-                selected_result_details = available_results.pop(best_result_id)
-                logging.info(f"Attempting to use selected result: {selected_result_details['title']} - {selected_result_details['link']}")
-            
-            except IndexError:
-                logging.error(f"Selected ID {best_result_id} is out of bounds for available_results (len {len(available_results)+1}). Taking first.")
-                if not available_results: break
-                selected_result_details = available_results.pop(0)
+        index = next((i for i, result in enumerate(available_results) if result['id'] == best_result_id), None)
+        
+        if index is None:
+            logger.warning("Could not select a best result from remaining items. Falling back to the first remaining result.")
+            index = 0
+        
+        selected_result_details = available_results.pop(index)
+        logger.info(f"Attempting to use selected result: {selected_result_details['title']} - {selected_result_details['link']}")
 
 
         page_url = selected_result_details['link']
-        page_content = scrape_webpage_content(page_url)
+        page_content = await scrape_futures[selected_result_details['id']]
         
         if page_content:
             
-            if is_content_relevant(page_content, last_user_prompt_content, generated_query):
-                logging.info(f"Relevant content found from: {page_url}")
-                logging.info("--- AI Search Pipeline Completed Successfully ---")
+            if await is_content_relevant(page_content, last_user_prompt_content, generated_query):
+                logger.info(f"Relevant content found from: {page_url}")
+                logger.info("--- AI Search Pipeline Completed Successfully ---")
                 
                 return page_content
             
             else:
-                logging.info(f"Content from {page_url} deemed not relevant. Trying next result.")
+                logger.info(f"Content from {page_url} deemed not relevant. Trying next result.")
         
         else:
-            logging.info(f"No content scraped from {page_url} or scraping failed. Trying next result.")
+            logger.info(f"No content scraped from {page_url} or scraping failed. Trying next result.")
             
-    logging.warning("--- AI Search Pipeline Completed: No relevant context found after trying available results. ---")
+    logger.warning("--- AI Search Pipeline Completed: No relevant context found after trying available results. ---")
     
     return None
 
 
-def stream_and_record_assistant_response():
+async def stream_and_record_assistant_response():
     """Streams the assistant's response and records it to conversation history."""
     
-    global conversation_history
-    
-    logging.info("Streaming assistant's final response...")
-    if not conversation_history:
-        logging.error("Conversation history is empty, cannot generate response.")
-        return
+    logger.info("Streaming assistant's final response...")
 
     try:
         
-        response_stream = ollama.chat(
-            model=OLLAMA_MODEL,
-            messages=conversation_history,
+        response_stream = await _OLLAMA_CLIENT.chat(
+            model=OLLAMA_MAIN_MODEL,
+            messages=conversation_store.messages(),
             stream=True,
-            options={"temperature": 0.7}
+            options={"temperature": 0.7, "num_ctx": OLLAMA_NUM_CTX},
+            keep_alive=OLLAMA_KEEP_ALIVE,
         )
         
-        complete_response_content = ''
+        tokens = []
         
         print("\nASSISTANT:")
         
-        for chunk in response_stream:
+        async for chunk in response_stream:
             
             token = chunk['message']['content']
-            print(token, end='', flush=True)
-            complete_response_content += token
+            tokens.append(token)
+            sys.stdout.write(token)
+            
+            if len(tokens) % STREAM_FLUSH_EVERY == 0:
+                sys.stdout.flush()
             
-        conversation_history.append({'role': 'assistant', 'content': complete_response_content})
+            if chunk.get('done'):
+                # Drops sharply when Ollama reuses the KV cache of the unchanged history prefix.
+                logger.info(f"Prompt tokens evaluated: {chunk.get('prompt_eval_count')}")
+            
+        sys.stdout.flush()
+        await conversation_store.append({'role': 'assistant', 'content': ''.join(tokens)})
         
         print('\n\n')
-        logging.info("Assistant response streamed and recorded.")
+        logger.info("Assistant response streamed and recorded.")
 
     except Exception as e:
-        logging.error(f"Error streaming assistant response: {e}", exc_info=True)
+        logger.error(f"Error streaming assistant response: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
         print("\n[ERROR] Sorry, I encountered a problem while generating my response.")
 
 
 
-def main():
+async def main():
     
-    global conversation_history
-    logging.info("Starting AI Assistant. Type 'quit' or 'exit' to end.")
+    logger.info("Starting AI Assistant. Type 'quit' or 'exit' to end.")
 
     while True:
         
@@ -386,62 +835,72 @@ def main():
             
             user_input = input('USER: \n')
             if user_input.lower() in ['quit', 'exit']:
-                logging.info("Exiting application.")
+                logger.info("Exiting application.")
                 break
             
             if not user_input.strip():
                 continue
 
 
-            conversation_history.append({'role': 'user', 'content': user_input})
+            await conversation_store.append({'role': 'user', 'content': user_input})
             
             last_user_prompt_content = user_input 
 
-            if should_search_web(last_user_prompt_content):
+            search_query = await decide_search_query(conversation_store.messages())
+            
+            if search_query:
                 
-                logging.info("Web search is required.")
+                logger.info("Web search is required.")
                 
-                retrieved_context = run_ai_search_pipeline(last_user_prompt_content)
+                retrieved_context = await run_ai_search_pipeline(last_user_prompt_content, search_query)
                 
-                current_user_message_entry = conversation_history.pop()
-                original_user_prompt_for_final_response = current_user_message_entry['content']
-
+                # The user message is left as is and the search outcome is added after it, so the
+                # history already sent to Ollama stays an unchanged prefix whose KV cache it can reuse.
                 if retrieved_context:
                     
-                    prompt_with_context = (
-                        f"Based on the following information: \n---BEGIN INFO---\n{retrieved_context}\n---END INFO---\n\n"
-                        f"Please answer this question or address this request: \"{original_user_prompt_for_final_response}\""
+                    # Only the passages matching the query are kept, so the stored context stays
+                    # small enough for several turns to fit in OLLAMA_NUM_CTX.
+                    retrieved_context = select_relevant_passage(
+                        retrieved_context,
+                        search_query,
+                        top_k=CONTEXT_TOP_SENTENCES,
+                        max_tokens=CONTEXT_MAX_TOKENS,
+                    )
+                    
+                    context_message = (
+                        f"SEARCH RESULT for the last user message: \n---BEGIN INFO---\n{retrieved_context}\n---END INFO---\n\n"
+                        "Use this information to answer the user's last message."
                     )
                     
-                    conversation_history.append({'role': 'user', 'content': prompt_with_context})
+                    await conversation_store.append({'role': 'system', 'content': context_message})
                     
-                    logging.info("Added retrieved context to user prompt for final response.")
+                    logger.info("Added retrieved context after the user prompt for final response.")
                     
                 else:
                     
-                    prompt_informing_failed_search = (
-                        f"I tried to find information on the web to answer your request: \"{original_user_prompt_for_final_response}\", "
-                        "but I couldn't find relevant information or the search failed. "
-                        "Please answer based on your general knowledge, or state that you couldn't find the specific information."
+                    failed_search_message = (
+                        "A web search was attempted to answer the user's last message, "
+                        "but no relevant information was found or the search failed. "
+                        "Answer based on your general knowledge, or state that you couldn't find the specific information."
                     )
                     
-                    conversation_history.append({'role': 'user', 'content': prompt_informing_failed_search})
+                    await conversation_store.append({'role': 'system', 'content': failed_search_message})
                     
-                    logging.info("Informed LLM about failed search in the user prompt.")
+                    logger.info("Informed LLM about failed search after the user prompt.")
                     
             else:
-                logging.info("No web search required. Responding directly.")
+                logger.info("No web search required. Responding directly.")
 
-            stream_and_record_assistant_response()
+            await stream_and_record_assistant_response()
 
         except KeyboardInterrupt:
-            logging.info("\nUser interrupted. Exiting application.")
+            logger.info("\nUser interrupted. Exiting application.")
             break
         
         except Exception as e:
-            logging.critical(f"An unexpected error occurred in the main loop: {e}", exc_info=True)
+            logger.critical(f"An unexpected error occurred in the main loop: {e}", exc_info=True)
             print("\n[CRITICAL ERROR] An unexpected error occurred. Please check logs. Restarting loop if possible.")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+from typing import Callable
+
+from diskcache import Cache
+from phi.tools.duckduckgo import DuckDuckGo
+from phi.tools.googlesearch import GoogleSearch
+
+
+SEARCH_CACHE_DIR = "tmp/search_cache"
+SEARCH_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+_search_cache = Cache(SEARCH_CACHE_DIR)
+
+
+def _cached_search(key: tuple, search: Callable[[], str]) -> str:
+    """
+    Returns the cached result for `key`, or runs `search` and caches its result.
+    Empty results are not cached so a failed search is retried on the next run.
+    """
+
+    result = _search_cache.get(key)
+    if result is not None:
+        logging.info(f"Search cache hit for: '{key[1]}'")
+        return result
+
+    result = search()
+    if result:
+        _search_cache.set(key, result, expire=SEARCH_CACHE_TTL_SECONDS)
+
+    return result
+
+
+class CachedDuckDuckGo(DuckDuckGo):
+    """DuckDuckGo tool whose results are cached on disk, keyed by (query, max_results)."""
+
+    def duckduckgo_search(self, query: str, max_results: int = 5) -> str:
+        max_results = getattr(self, "fixed_max_results", None) or max_results
+        return _cached_search(
+            ("duckduckgo_search", query, max_results),
+            lambda: super(CachedDuckDuckGo, self).duckduckgo_search(query, max_results=max_results),
+        )
+
+    def duckduckgo_news(self, query: str, max_results: int = 5) -> str:
+        max_results = getattr(self, "fixed_max_results", None) or max_results
+        return _cached_search(
+            ("duckduckgo_news", query, max_results),
+            lambda: super(CachedDuckDuckGo, self).duckduckgo_news(query, max_results=max_results),
+        )
+
+    # phi describes tools to the LLM from their docstrings, so keep the originals.
+    duckduckgo_search.__doc__ = DuckDuckGo.duckduckgo_search.__doc__
+    duckduckgo_news.__doc__ = DuckDuckGo.duckduckgo_news.__doc__
+
+
+class CachedGoogleSearch(GoogleSearch):
+    """GoogleSearch tool whose results are cached on disk, keyed by (query, max_results)."""
+
+    def google_search(self, query: str, max_results: int = 5, language: str = "en") -> str:
+        max_results = getattr(self, "fixed_max_results", None) or max_results
+        return _cached_search(
+            ("google_search", query, max_results, language),
+            lambda: super(CachedGoogleSearch, self).google_search(query, max_results=max_results, language=language),
+        )
+
+    google_search.__doc__ = GoogleSearch.google_search.__doc__
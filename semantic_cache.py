@@ -0,0 +1,227 @@
+import asyncio
+import atexit
+import functools
+import inspect
+import logging
+import os
+import pickle
+import threading
+from hashlib import md5
+from typing import Any, Callable
+
+import numpy as np
+import ollama
+
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_PATH = "tmp/semantic_cache.pkl"
+SEMANTIC_CACHE_EMBED_MODEL = "nomic-embed-text"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_PCA_MIN_ENTRIES = 1000
+SEMANTIC_CACHE_PCA_DIMENSIONS = 128
+
+
+class SemanticCache:
+    """
+    In-memory cache of LLM responses looked up by embedding similarity instead of exact text,
+    so near-duplicate prompts reuse an earlier answer.
+
+    Entries are grouped by namespace (e.g. model + system prompt), and only compared within
+    it. Each namespace holds an (N, D) matrix of L2-normalized embeddings plus the parallel
+    list of cached values; once it grows past SEMANTIC_CACHE_PCA_MIN_ENTRIES, its vectors are
+    projected to SEMANTIC_CACHE_PCA_DIMENSIONS with PCA to keep lookups cheap.
+    The cache is pickled to `path` on exit and reloaded on the next run.
+    """
+
+    def __init__(
+        self,
+        path: str = SEMANTIC_CACHE_PATH,
+        embed_model: str = SEMANTIC_CACHE_EMBED_MODEL,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD):
+
+        self.path = path
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.enabled = True
+
+        self._lock = threading.Lock()
+        self._namespaces: dict[str, dict[str, Any]] = self._load()
+
+        atexit.register(self.save)
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, "rb") as f:
+                namespaces = pickle.load(f)
+
+            logger.info(f"Loaded semantic cache with {sum(len(ns['values']) for ns in namespaces.values())} entries.")
+            return namespaces
+
+        except Exception as e:
+            logger.warning(f"Could not load semantic cache from {self.path}: {e}")
+            return {}
+
+    def save(self):
+        with self._lock:
+            if not self._namespaces:
+                return
+
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "wb") as f:
+                    pickle.dump(self._namespaces, f)
+
+            except Exception as e:
+                logger.warning(f"Could not save semantic cache to {self.path}: {e}")
+
+    def _embed(self, text: str) -> np.ndarray | None:
+        if not self.enabled:
+            return None
+
+        try:
+            response = ollama.embeddings(model=self.embed_model, prompt=text)
+
+        except Exception as e:
+            # Usually the embedding model is not pulled; don't retry on every call.
+            logger.warning(f"Semantic cache disabled, embedding with '{self.embed_model}' failed: {e}")
+            self.enabled = False
+            return None
+
+        vector = np.asarray(response["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+
+        return vector / norm if norm else None
+
+    @staticmethod
+    def _project(namespace: dict[str, Any], vector: np.ndarray) -> np.ndarray:
+        if namespace["projection"] is None:
+            return vector
+
+        mean, components = namespace["projection"]
+        projected = components @ (vector - mean)
+        norm = np.linalg.norm(projected)
+
+        return projected / norm if norm else projected
+
+    @staticmethod
+    def _fit_projection(namespace: dict[str, Any]):
+        """Replaces the namespace's vectors by their top principal components, re-normalized."""
+
+        vectors = namespace["vectors"]
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+
+        namespace["projection"] = (mean, vt[:SEMANTIC_CACHE_PCA_DIMENSIONS])
+
+        projected = (vectors - mean) @ vt[:SEMANTIC_CACHE_PCA_DIMENSIONS].T
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        namespace["vectors"] = projected / np.where(norms == 0, 1, norms)
+
+        logger.info(f"Reduced semantic cache namespace to {SEMANTIC_CACHE_PCA_DIMENSIONS} dimensions over {len(vectors)} entries.")
+
+    def get(self, namespace: str, text: str) -> tuple[Any, np.ndarray | None]:
+        """
+        Looks up the value cached for the most similar text in the namespace.
+
+        Returns:
+            (value, embedding): value is None on a miss. The embedding can be passed back
+            to `put` so the text is not embedded twice.
+        """
+
+        vector = self._embed(text)
+        if vector is None:
+            return None, None
+
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None or not ns["values"]:
+                return None, vector
+
+            scores = ns["vectors"] @ self._project(ns, vector)
+            best = int(scores.argmax())
+
+            if scores[best] > self.threshold:
+                logger.info(f"Semantic cache hit (similarity {scores[best]:.3f}).")
+                return ns["values"][best], vector
+
+        return None, vector
+
+    def put(self, namespace: str, vector: np.ndarray, value: Any):
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, {"vectors": None, "values": [], "projection": None})
+            row = self._project(ns, vector)[np.newaxis, :]
+
+            ns["vectors"] = row if ns["vectors"] is None else np.vstack([ns["vectors"], row])
+            ns["values"].append(value)
+
+            if ns["projection"] is None and len(ns["values"]) > SEMANTIC_CACHE_PCA_MIN_ENTRIES:
+                self._fit_projection(ns)
+
+
+_semantic_cache: SemanticCache | None = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Returns the process-wide semantic cache, loading it from disk on first use."""
+
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache()
+    return _semantic_cache
+
+
+def semantic_cache(namespace: Callable[..., str], text: Callable[..., str], keep: Callable[[Any], bool] | None = None):
+    """
+    Decorator caching a function's non-None results in the shared SemanticCache.
+    Works on coroutine functions too; their cache lookups then run in a worker thread.
+
+    Args:
+        namespace: Builds, from the call's arguments, the part of the key that must match
+            exactly (e.g. model + system prompt). It is hashed to name the namespace.
+        text: Builds, from the call's arguments, the text matched by similarity.
+        keep: If given, only results for which it returns True are cached.
+    """
+
+    def decorator(func):
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                cache = get_semantic_cache()
+                ns = md5(namespace(*args, **kwargs).encode()).hexdigest()
+
+                cached, vector = await asyncio.to_thread(cache.get, ns, text(*args, **kwargs))
+                if cached is not None:
+                    return cached
+
+                result = await func(*args, **kwargs)
+                if result is not None and vector is not None and (keep is None or keep(result)):
+                    cache.put(ns, vector, result)
+
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_semantic_cache()
+            ns = md5(namespace(*args, **kwargs).encode()).hexdigest()
+
+            cached, vector = cache.get(ns, text(*args, **kwargs))
+            if cached is not None:
+                return cached
+
+            result = func(*args, **kwargs)
+            if result is not None and vector is not None and (keep is None or keep(result)):
+                cache.put(ns, vector, result)
+
+            return result
+
+        return wrapper
+
+    return decorator